@@ -1,76 +1,167 @@
-from collections import Counter, defaultdict
+from typing import Optional
 
 from infrahub_sdk.checks import InfrahubCheck
+from infrahub_sdk.exceptions import Error
+
+
+PAGE_SIZE = 500
+
+TOPOLOGY_GROUP_SUFFIX = "_topology"
+TOPOLOGY_ELEMENT_KINDS = ("TopologyPhysicalElement",)
+# Kinds the device counts depend on which can't be traced back to a topology
+UNMAPPED_KINDS = ("InfraDeviceType",)
 
 
 class InfrahubCheckDeviceTopology(InfrahubCheck):
 
     query = "check_device_topology"
+    devices_query = "check_device_topology_devices"
+
+    async def query_page(self, name: str, offset: int, **variables) -> dict:
+        response = await self.client.query_gql_query(
+            name=name, branch_name=self.branch_name, variables={"offset": offset, "limit": PAGE_SIZE, **variables}
+        )
+        return response.get("data") or response
+
+    async def collect_topologies(self) -> list:
+        topologies = []
+        offset = 0
+        while True:
+            page = (await self.query_page(self.query, offset))["TopologyTopology"]
+            topologies.extend(page["edges"])
+            offset += PAGE_SIZE
+            if offset >= page["count"] or not page["edges"]:
+                return topologies
+
+    async def collect_device_counts(self, group_names: list) -> tuple:
+        # Group name -> role -> device type -> number of devices, counted page by page
+        device_counts = {}
+        existing_groups = set()
+        offset = 0
+        while group_names:
+            page = await self.query_page(self.devices_query, offset, groups=group_names)
+            existing_groups.update(edge["node"]["name"]["value"] for edge in page["CoreStandardGroup"]["edges"])
+            for edge in page["InfraDevice"]["edges"]:
+                device = edge["node"]
+                role = device["role"]["value"]
+                device_type = device["device_type"]["node"]["name"]["value"]
+                for group_edge in device["member_of_groups"]["edges"]:
+                    group_name = group_edge["node"]["name"]["value"]
+                    if group_name in existing_groups:
+                        role_counts = device_counts.setdefault(group_name, {}).setdefault(role, {})
+                        role_counts[device_type] = role_counts.get(device_type, 0) + 1
+            offset += PAGE_SIZE
+            if offset >= page["InfraDevice"]["count"] or not page["InfraDevice"]["edges"]:
+                break
+        return existing_groups, device_counts
+
+    async def find_affected_topologies(self, topologies: list) -> Optional[set]:
+        """Returns the ids of the topologies touched by the branch diff, None when every topology has to be validated."""
+        if self.params.get("scope") == "all" or self.branch_name == self.client.default_branch:
+            return None
+        try:
+            node_diffs = await self.client.get_diff_summary(branch=self.branch_name)
+        except Error:
+            return None
+
+        topology_ids = {edge["node"]["name"]["value"]: edge["node"]["id"] for edge in topologies}
+        affected = set()
+        element_ids = []
+        device_ids = []
+        group_ids = []
+        for node_diff in node_diffs:
+            if node_diff["kind"] == "TopologyTopology":
+                affected.add(node_diff["id"])
+            elif node_diff["kind"] in TOPOLOGY_ELEMENT_KINDS:
+                element_ids.append(node_diff["id"])
+            elif node_diff["kind"] == "InfraDevice":
+                device_ids.append(node_diff["id"])
+            elif node_diff["kind"] == "CoreStandardGroup":
+                group_ids.append(node_diff["id"])
+            elif node_diff["kind"] in UNMAPPED_KINDS:
+                return None
+
+        if element_ids:
+            elements = await self.client.filters(kind="TopologyGenericElement", ids=element_ids, branch=self.branch_name)
+            # An element removed by the branch can't be traced back to its topology
+            if len(elements) != len(set(element_ids)):
+                return None
+            affected.update(element.topology.id for element in elements)
+
+        group_names = set()
+        if group_ids:
+            # The display label of a group isn't its name
+            groups = await self.client.filters(kind="CoreStandardGroup", ids=group_ids, branch=self.branch_name)
+            # A group removed by the branch can't be traced back to its topology
+            if len(groups) != len(set(group_ids)):
+                return None
+            group_names.update(group.name.value for group in groups)
+        if device_ids:
+            # The groups of the devices before and after the branch, to cover the devices moved or removed by it
+            for branch in (self.client.default_branch, self.branch_name):
+                groups = await self.client.filters(kind="CoreStandardGroup", members__ids=device_ids, branch=branch)
+                group_names.update(group.name.value for group in groups)
+        for group_name in group_names:
+            if group_name.endswith(TOPOLOGY_GROUP_SUFFIX):
+                affected.add(topology_ids.get(group_name[: -len(TOPOLOGY_GROUP_SUFFIX)]))
+
+        affected.discard(None)
+        return affected
+
+    async def collect_data(self) -> dict:
+        topologies = await self.collect_topologies()
+        # The topologies the branch didn't change are the same as on the default branch, validated there
+        affected = await self.find_affected_topologies(topologies)
+        if affected is not None:
+            topologies = [edge for edge in topologies if edge["node"]["id"] in affected]
+
+        group_names = [f"{edge['node']['name']['value']}{TOPOLOGY_GROUP_SUFFIX}" for edge in topologies]
+        existing_groups, device_counts = await self.collect_device_counts(group_names)
+        return {"topologies": topologies, "groups": sorted(existing_groups), "device_counts": device_counts}
 
     def validate(self, data):
-        # Extract Topology and Group data
-        topologies = data["TopologyTopology"]["edges"]
-        groups = data["CoreStandardGroup"]["edges"]
-
-        # Map of group names to device IDs
-        group_devices = {group["node"]["name"]["value"]: {edge["node"]["id"] for edge in group["node"]["members"]["edges"] if edge["node"]} for group in groups}
-
-        # Map of device IDs to device info
-        device_map = {edge["node"]["id"]: edge["node"] for edge in data["InfraDevice"]["edges"]}
-
-        for topology_edge in topologies:
-            topology_node = topology_edge["node"]
-            topology_name = topology_node["name"]["value"]
-            group_name = f"{topology_name}_topology"
-
-            if group_name not in group_devices:
-                self.log_error(
-                    message=f"No corresponding group found for topology {topology_name}."
-                )
-                continue
-            group_device_ids = group_devices[group_name]
-            expected_role_device_counts = {}
-
-            # Processing expected roles and device types
-            for element_edge in topology_node["elements"]["edges"]:
-                element_node = element_edge["node"]
-                role = element_node["device_role"]["value"]
-                device_type = element_node["device_type"]["node"]["name"]["value"]
-                quantity = element_node["quantity"]["value"]
-
-                if role not in expected_role_device_counts:
-                    expected_role_device_counts[role] = {}
-                expected_role_device_counts[role][device_type] = quantity
-
-            # Actual role and device type counts
-            actual_role_device_counts = {}
-            for device_id in group_device_ids:
-                if device_id in device_map:
-                    device = device_map[device_id]
-                    role = device["role"]["value"]
-                    device_type = device["device_type"]["node"]["name"]["value"]
-
-                    if role not in actual_role_device_counts:
-                        actual_role_device_counts[role] = {}
-                    actual_role_device_counts[role][device_type] = actual_role_device_counts[role].get(device_type, 0) + 1
-
-            # Comparison of expected vs actual, including device type check
-            for role, expected_types in expected_role_device_counts.items():
-                for expected_type, expected_count in expected_types.items():
-                    actual_count = actual_role_device_counts.get(role, {}).get(expected_type, 0)
-                    unexpected_types = [actual_type for actual_type in actual_role_device_counts.get(role, {}) if actual_type != expected_type]
-
-                    if expected_count % 2 != 0:
-                        self.log_error(
-                            message=f"{topology_name} has an odd number of Elements for role {role}. Expected: {expected_count}"
-                        )
-                    if actual_count > 0:
-                        if expected_count != actual_count:
-                            self.log_error(
-                                message=f"{topology_name} has mismatched quantity of {expected_type} devices with role {role}. Expected: {expected_count}, Actual: {actual_count}"
-                            )
-                    if expected_type not in actual_role_device_counts.get(role, {}) and unexpected_types:
-                        unexpected_types_str = ", ".join(unexpected_types)
-                        self.log_error(
-                            message=f"{topology_name} expected {expected_type} devices with role {role}, but found different type(s): {unexpected_types_str}."
-                        )
+        group_names = set(data["groups"])
+        for topology_edge in data["topologies"]:
+            for error in self.validate_topology(topology_edge["node"], group_names, data["device_counts"]):
+                self.log_error(message=error)
+
+    def validate_topology(self, topology_node: dict, group_names: set, device_counts: dict) -> list:
+        errors = []
+        topology_name = topology_node["name"]["value"]
+        group_name = f"{topology_name}{TOPOLOGY_GROUP_SUFFIX}"
+
+        if group_name not in group_names:
+            errors.append(f"No corresponding group found for topology {topology_name}.")
+            return errors
+        expected_role_device_counts = {}
+
+        # Processing expected roles and device types
+        for element_edge in topology_node["elements"]["edges"]:
+            element_node = element_edge["node"]
+            role = element_node["device_role"]["value"]
+            device_type = element_node["device_type"]["node"]["name"]["value"]
+            quantity = element_node["quantity"]["value"]
+
+            if role not in expected_role_device_counts:
+                expected_role_device_counts[role] = {}
+            expected_role_device_counts[role][device_type] = quantity
+
+        # Actual role and device type counts
+        actual_role_device_counts = device_counts.get(group_name, {})
+
+        # Comparison of expected vs actual, including device type check
+        for role, expected_types in expected_role_device_counts.items():
+            for expected_type, expected_count in expected_types.items():
+                actual_count = actual_role_device_counts.get(role, {}).get(expected_type, 0)
+                unexpected_types = [actual_type for actual_type in actual_role_device_counts.get(role, {}) if actual_type != expected_type]
+
+                if expected_count % 2 != 0:
+                    errors.append(f"{topology_name} has an odd number of Elements for role {role}. Expected: {expected_count}")
+                if actual_count > 0:
+                    if expected_count != actual_count:
+                        errors.append(f"{topology_name} has mismatched quantity of {expected_type} devices with role {role}. Expected: {expected_count}, Actual: {actual_count}")
+                if expected_type not in actual_role_device_counts.get(role, {}) and unexpected_types:
+                    unexpected_types_str = ", ".join(unexpected_types)
+                    errors.append(f"{topology_name} expected {expected_type} devices with role {role}, but found different type(s): {unexpected_types_str}.")
+
+        return errors
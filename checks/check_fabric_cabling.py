@@ -0,0 +1,201 @@
+from ipaddress import ip_interface
+from socket import inet_aton
+
+import numpy as np
+
+from infrahub_sdk.checks import InfrahubCheck
+
+
+PAGE_SIZE = 500
+
+TOPOLOGY_GROUP_SUFFIX = "_topology"
+
+SPINE, LEAF, OTHER = 0, 1, 2
+FABRIC_ROLES = {"spine": SPINE, "leaf": LEAF}
+PEER_INTERFACE_ROLE = "peer"
+
+# connected_endpoint values that are not an interface of the topology
+NOT_CONNECTED = -2
+OUTSIDE_TOPOLOGY = -1
+
+
+def parse_network(address: str) -> tuple:
+    """Returns a key of the network of an interface address and whether it's a point-to-point (/31, /127) network."""
+    host, _, length = address.partition("/")
+    if ":" not in host and length:
+        # Plain integer arithmetic, ipaddress is the bottleneck on large fabrics
+        prefixlen = int(length)
+        value = int.from_bytes(inet_aton(host), "big")
+        return (4, value >> (32 - prefixlen), prefixlen), prefixlen == 31
+    interface = ip_interface(address)
+    return interface.network, interface.network.prefixlen == interface.max_prefixlen - 1
+
+
+class FabricGraph:
+    """Devices and interfaces of a topology as arrays indexed by device and by port."""
+
+    def __init__(self, devices: list) -> None:
+        self.device_names = []
+        device_roles = []
+        self.port_names = []
+        port_devices = []
+        port_is_peer = []
+        port_endpoints = []
+        port_networks = []
+        port_is_p2p = []
+        networks = {}
+        port_index = {}
+
+        for device_index, device in enumerate(devices):
+            self.device_names.append(device["name"]["value"])
+            device_roles.append(FABRIC_ROLES.get(device["role"]["value"], OTHER))
+            for edge in device["interfaces"]["edges"]:
+                interface = edge["node"]
+                port_index[interface["id"]] = len(self.port_names)
+                self.port_names.append(f"{device['name']['value']}:{interface['name']['value']}")
+                port_devices.append(device_index)
+                port_is_peer.append((interface.get("role") or {}).get("value") == PEER_INTERFACE_ROLE)
+                endpoint = (interface.get("connected_endpoint") or {}).get("node")
+                port_endpoints.append(endpoint["id"] if endpoint else None)
+
+                addresses = (interface.get("ip_addresses") or {}).get("edges") or []
+                if addresses:
+                    network, is_p2p = parse_network(addresses[0]["node"]["address"]["value"])
+                    port_networks.append(networks.setdefault(network, len(networks)))
+                    port_is_p2p.append(is_p2p)
+                else:
+                    port_networks.append(-1)
+                    port_is_p2p.append(False)
+
+        self.device_roles = np.array(device_roles, dtype=np.int64)
+        self.port_devices = np.array(port_devices, dtype=np.int64)
+        self.port_is_peer = np.array(port_is_peer, dtype=bool)
+        self.port_networks = np.array(port_networks, dtype=np.int64)
+        self.port_is_p2p = np.array(port_is_p2p, dtype=bool)
+        self.port_peers = np.array(
+            [port_index.get(endpoint, OUTSIDE_TOPOLOGY) if endpoint else NOT_CONNECTED for endpoint in port_endpoints],
+            dtype=np.int64,
+        )
+
+        connected = self.port_peers >= 0
+        # Device at the other end of each port, -1 when the port isn't connected inside the topology
+        self.port_peer_devices = np.where(connected, self.port_devices[np.maximum(self.port_peers, 0)], -1)
+
+    def missing_spine_leaf_links(self) -> list:
+        spines = np.flatnonzero(self.device_roles == SPINE)
+        leaves = np.flatnonzero(self.device_roles == LEAF)
+        if not spines.size or not leaves.size:
+            return []
+        position = np.full(self.device_roles.shape, -1, dtype=np.int64)
+        position[spines] = np.arange(spines.size)
+        position[leaves] = np.arange(leaves.size)
+
+        peer_roles = np.where(self.port_peer_devices >= 0, self.device_roles[np.maximum(self.port_peer_devices, 0)], OTHER)
+        links = (self.device_roles[self.port_devices] == SPINE) & (peer_roles == LEAF)
+        adjacency = np.zeros((spines.size, leaves.size), dtype=np.int64)
+        np.add.at(adjacency, (position[self.port_devices[links]], position[self.port_peer_devices[links]]), 1)
+        return [
+            (self.device_names[spines[spine]], self.device_names[leaves[leaf]])
+            for spine, leaf in np.argwhere(adjacency == 0)
+        ]
+
+    def asymmetric_links(self) -> list:
+        ports = np.flatnonzero(self.port_peers >= 0)
+        back = self.port_peers[self.port_peers[ports]]
+        return [(self.port_names[port], self.port_names[self.port_peers[port]]) for port in ports[back != ports]]
+
+    def ip_pairing_errors(self) -> list:
+        ports = np.flatnonzero(self.port_peers >= 0)
+        peers = self.port_peers[ports]
+        # Each symmetric link is looked at once, from its lowest port
+        ports, peers = ports[ports < peers], peers[ports < peers]
+        ports, peers = ports[self.port_peers[peers] == ports], peers[self.port_peers[peers] == ports]
+
+        has_ip = self.port_networks >= 0
+        errors = []
+        for port, peer in zip(ports[has_ip[ports] != has_ip[peers]], peers[has_ip[ports] != has_ip[peers]]):
+            errors.append(f"Only one end of {self.port_names[port]} <-> {self.port_names[peer]} has an IP address.")
+        both = has_ip[ports] & has_ip[peers]
+        ports, peers = ports[both], peers[both]
+        for port, peer in zip(ports[self.port_networks[ports] != self.port_networks[peers]], peers[self.port_networks[ports] != self.port_networks[peers]]):
+            errors.append(f"{self.port_names[port]} <-> {self.port_names[peer]} are addressed in different prefixes.")
+        not_p2p = ~(self.port_is_p2p[ports] & self.port_is_p2p[peers])
+        for port, peer in zip(ports[not_p2p], peers[not_p2p]):
+            errors.append(f"{self.port_names[port]} <-> {self.port_names[peer]} is not addressed with a /31.")
+        return errors
+
+    def mlag_errors(self) -> list:
+        errors = []
+        peer_ports = self.port_is_peer & (self.device_roles[self.port_devices] == LEAF)
+        for port in np.flatnonzero(peer_ports & (self.port_peers < 0)):
+            errors.append(f"MLAG peer interface {self.port_names[port]} is not connected to the topology.")
+
+        connected = peer_ports & (self.port_peers >= 0)
+        device_count = len(self.device_names)
+        lowest = np.full(device_count, device_count, dtype=np.int64)
+        highest = np.full(device_count, -1, dtype=np.int64)
+        np.minimum.at(lowest, self.port_devices[connected], self.port_peer_devices[connected])
+        np.maximum.at(highest, self.port_devices[connected], self.port_peer_devices[connected])
+
+        split = (highest >= 0) & (lowest != highest)
+        for device in np.flatnonzero(split):
+            errors.append(f"{self.device_names[device]} has MLAG peer interfaces connected to different devices.")
+
+        partners = np.where((highest >= 0) & ~split, highest, -1)
+        has_partner = partners >= 0
+        partner_roles = np.where(has_partner, self.device_roles[np.maximum(partners, 0)], OTHER)
+        for device in np.flatnonzero(has_partner & (partner_roles != LEAF)):
+            errors.append(f"{self.device_names[device]} has its MLAG peer interfaces connected to {self.device_names[partners[device]]}, which is not a leaf.")
+        partners_of_partners = np.where(has_partner, partners[np.maximum(partners, 0)], -1)
+        for device in np.flatnonzero(has_partner & (partner_roles == LEAF) & (partners_of_partners != np.arange(device_count))):
+            errors.append(f"{self.device_names[device]} and {self.device_names[partners[device]]} are not MLAG peers of each other.")
+        return errors
+
+
+class InfrahubCheckFabricCabling(InfrahubCheck):
+
+    query = "check_fabric_cabling"
+
+    async def collect_data(self) -> dict:
+        if "topology" in self.params:
+            topology_names = [self.params["topology"]]
+        else:
+            topologies = await self.client.filters(kind="TopologyTopology", branch=self.branch_name)
+            topology_names = [topology.name.value for topology in topologies]
+        group_names = [f"{name}{TOPOLOGY_GROUP_SUFFIX}" for name in topology_names]
+
+        # Group name -> devices of the group
+        group_devices = {group_name: [] for group_name in group_names}
+        offset = 0
+        while group_names:
+            response = await self.client.query_gql_query(
+                name=self.query,
+                branch_name=self.branch_name,
+                variables={"groups": group_names, "offset": offset, "limit": PAGE_SIZE},
+            )
+            page = (response.get("data") or response)["InfraDevice"]
+            for edge in page["edges"]:
+                for group_edge in edge["node"]["member_of_groups"]["edges"]:
+                    group_name = group_edge["node"]["name"]["value"]
+                    if group_name in group_devices:
+                        group_devices[group_name].append(edge["node"])
+            offset += PAGE_SIZE
+            if offset >= page["count"] or not page["edges"]:
+                break
+
+        return {
+            "topologies": {
+                group_name[: -len(TOPOLOGY_GROUP_SUFFIX)]: devices for group_name, devices in group_devices.items()
+            }
+        }
+
+    def validate(self, data):
+        for topology_name, devices in data["topologies"].items():
+            graph = FabricGraph(devices)
+
+            for spine, leaf in graph.missing_spine_leaf_links():
+                self.log_error(message=f"{topology_name}: {spine} is not connected to {leaf}.")
+            for port, peer in graph.asymmetric_links():
+                self.log_error(message=f"{topology_name}: {port} is connected to {peer}, but {peer} is not connected back.")
+            for error in graph.ip_pairing_errors() + graph.mlag_errors():
+                self.log_error(message=f"{topology_name}: {error}")
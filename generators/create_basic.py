@@ -1,5 +1,8 @@
+import asyncio
 import logging
-from typing import Dict, Optional
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk.node import InfrahubNode
 from infrahub_sdk.store import NodeStore
@@ -140,14 +143,7 @@ BGP_PEER_GROUPS = (
 
 store = NodeStore()
 
-async def create_basics(
-        client: InfrahubClient,
-        log: logging.Logger,
-        branch: str
-    ):
-    # Create Batch for Accounts, Platforms, and Standards Groups
-    log.info("Creating User Accounts, Platforms, and Standard Groups")
-    batch = await client.create_batch()
+async def create_accounts(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create User Accounts
     # ------------------------------------------
@@ -169,6 +165,7 @@ async def create_basics(
             batch=batch
             )
 
+async def create_groups(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create Standard Demo Groups
     # ------------------------------------------
@@ -188,18 +185,10 @@ async def create_basics(
             batch=batch
             )
 
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
-
+async def create_organizations(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
-    # Create Organization & Autonomous System
+    # Create Organization
     # ------------------------------------------
-    log.info("Creating Organizations, and Autonomous Systems")
-    account = store.get("CRM Synchronization", kind="CoreAccount")
-    account2 = store.get("Chloe O'Brian", kind="CoreAccount")
-    # Organization
-    batch = await client.create_batch()
     for org in ORGANIZATIONS:
         data_org={
             "name": {"value": org[0], "is_protected": True},
@@ -214,13 +203,14 @@ async def create_basics(
             store=store,
             batch=batch
             )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
-    # Autonomous System
+async def create_autonomous_systems(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
+    # ------------------------------------------
+    # Create Autonomous System
+    # ------------------------------------------
+    account = store.get("CRM Synchronization", kind="CoreAccount")
+    account2 = store.get("Chloe O'Brian", kind="CoreAccount")
     organizations_dict = {name: type for name, type in ORGANIZATIONS}
-    batch = await client.create_batch()
     for asn in ASNS:
         organization_type = organizations_dict.get(asn[1], None)
         asn_name  = f"AS{asn[0]}"
@@ -261,16 +251,12 @@ async def create_basics(
             store=store,
             batch=batch
         )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
+async def create_tags(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create Tags
     # ------------------------------------------
-    account = store.get("CRM Synchronization")
-    batch = await client.create_batch()
-    log.info("Creating Tags")
+    account = store.get("CRM Synchronization", kind="CoreAccount")
     for tag in TAGS:
         data={
             "name": {"value": tag, "source": account.id},
@@ -285,14 +271,11 @@ async def create_basics(
             store=store,
             batch=batch
             )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
+async def create_platforms(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create Platform
     # ------------------------------------------
-    batch = await client.create_batch()
     for platform in PLATFORMS:
        manufacturer_name = platform[0].split()[0].title()
        manufacturer = store.get(key=manufacturer_name, kind="OrganizationManufacturer", raise_when_missing=False)
@@ -316,15 +299,11 @@ async def create_basics(
            store=store,
            batch=batch
         )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
+async def create_device_types(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create Standard Device Type
     # ------------------------------------------
-    batch = await client.create_batch()
-    log.info("Creating Standard Device Type")
     for device_type in DEVICE_TYPES:
        manufacturer_name = device_type[4].split()[0].title()
        manufacturer = store.get(key=manufacturer_name, kind="OrganizationManufacturer", raise_when_missing=False)
@@ -348,16 +327,12 @@ async def create_basics(
            store=store,
            batch=batch
        )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
+async def create_bgp_peer_groups(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
     # ------------------------------------------
     # Create BGP Peer Groups
     # ------------------------------------------
-    log.info(f"Creating BGP Peer Groups")
     account = store.get(key="pop-builder", kind="CoreAccount")
-    batch = await client.create_batch()
     for peer_group in BGP_PEER_GROUPS:
         remote_as = remote_as_id = None
         if peer_group[4]:
@@ -385,12 +360,12 @@ async def create_basics(
             store=store,
             batch=batch,
             )
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
-    batch = await client.create_batch()
-    log.info(f"Creating Route Targets")
+async def create_route_targets(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
+    # ------------------------------------------
+    # Create Route Targets
+    # ------------------------------------------
+    account = store.get(key="pop-builder", kind="CoreAccount")
     for route_target in ROUTE_TARGETS:
         rt_name = route_target[0]
         rt_description = route_target[1]
@@ -409,12 +384,11 @@ async def create_basics(
             batch=batch,
             )
 
-    async for node, _ in batch.execute():
-        accessor = f"{node._schema.default_filter.split('__')[0]}"
-        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
-
-    log.info(f"Creating VRF")
-    batch = await client.create_batch()
+async def create_vrfs(client: InfrahubClient, log: logging.Logger, branch: str, batch: InfrahubBatch) -> None:
+    # ------------------------------------------
+    # Create VRF
+    # ------------------------------------------
+    account = store.get(key="pop-builder", kind="CoreAccount")
     for vrf in VRF:
         vrf_name = vrf[0]
         vrf_description = vrf[1]
@@ -440,10 +414,59 @@ async def create_basics(
             store=store,
             batch=batch,
             )
+
+@dataclass
+class SeedStep:
+    name: str
+    label: str
+    loader: Callable[[InfrahubClient, logging.Logger, str, InfrahubBatch], Awaitable[None]]
+    depends_on: Tuple[str, ...] = ()
+
+# A step only waits for the steps it reads from the store, all the others load concurrently
+SEED_STEPS = (
+    SeedStep(name="accounts", label="User Accounts", loader=create_accounts),
+    SeedStep(name="groups", label="Standard Groups", loader=create_groups),
+    SeedStep(name="organizations", label="Organizations", loader=create_organizations),
+    SeedStep(name="autonomous_systems", label="Autonomous Systems", loader=create_autonomous_systems, depends_on=("accounts", "organizations")),
+    SeedStep(name="tags", label="Tags", loader=create_tags, depends_on=("accounts",)),
+    SeedStep(name="platforms", label="Platforms", loader=create_platforms, depends_on=("organizations",)),
+    SeedStep(name="device_types", label="Standard Device Types", loader=create_device_types, depends_on=("organizations", "platforms")),
+    SeedStep(name="bgp_peer_groups", label="BGP Peer Groups", loader=create_bgp_peer_groups, depends_on=("accounts", "autonomous_systems")),
+    SeedStep(name="route_targets", label="Route Targets", loader=create_route_targets, depends_on=("accounts",)),
+    SeedStep(name="vrfs", label="VRF", loader=create_vrfs, depends_on=("accounts", "route_targets")),
+)
+
+async def run_seed_step(client: InfrahubClient, log: logging.Logger, branch: str, step: SeedStep) -> None:
+    log.info(f"Creating {step.label}")
+    batch = await client.create_batch()
+    await step.loader(client=client, log=log, branch=branch, batch=batch)
     async for node, _ in batch.execute():
         accessor = f"{node._schema.default_filter.split('__')[0]}"
         log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
+async def create_basics(
+        client: InfrahubClient,
+        log: logging.Logger,
+        branch: str
+    ):
+    steps = {step.name: step for step in SEED_STEPS}
+    # Fails early on unknown dependencies or cycles
+    for step in SEED_STEPS:
+        for dependency in step.depends_on:
+            if dependency not in steps:
+                raise ValueError(f"Seed step {step.name} depends on unknown step {dependency}")
+    TopologicalSorter({step.name: step.depends_on for step in SEED_STEPS}).prepare()
+
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_after_dependencies(step: SeedStep) -> None:
+        await asyncio.gather(*(tasks[dependency] for dependency in step.depends_on))
+        await run_seed_step(client=client, log=log, branch=branch, step=step)
+
+    for step in SEED_STEPS:
+        tasks[step.name] = asyncio.create_task(run_after_dependencies(step))
+    await asyncio.gather(*tasks.values())
+
 # ---------------------------------------------------------------
 # Use the `infrahubctl run` command line to execute this script
 #
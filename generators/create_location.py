@@ -2,8 +2,9 @@ import logging
 import uuid
 import random
 from collections import defaultdict
+from functools import lru_cache
 from ipaddress import IPv4Network
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk.node import InfrahubNode
@@ -11,7 +12,7 @@ from infrahub_sdk.store import NodeStore
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.uuidt import UUIDT
 
-from utils import create_and_save, create_and_add_to_batch, populate_local_store
+from utils import PrefixTree, create_and_save, create_and_add_to_batch, get_subnet_by_index, populate_local_store
 
 # flake8: noqa
 # pylint: skip-file
@@ -263,33 +264,70 @@ MGMT_SERVERS = {
     ("time.cloudflare.com", "Cloudflare time", "NTP"),
 }
 
-# We filter locations to include only those of type 'site'
-site_locations = []
-for continent_name, continent_data in LOCATIONS.items():
-    for country_name, country_data in continent_data["countries"].items():
-        for region_name, region_data in country_data.get("regions", {}).items():
-            for metro_name, metro_data in region_data.get("metros", {}).items():
-                for building_name, building_data in metro_data.get("buildings", {}).items():
-                    site_locations.append({"name": building_name, "shortname": building_data["shortname"]})
-
-# We assigned a /16 per Location for "data" (257 Site possibles)
-INTERNAL_POOL = IPv4Network("10.0.0.0/8").subnets(new_prefix=16)
-LOCATION_SUPERNETS = {location["shortname"]: next(INTERNAL_POOL) for location in site_locations}
-
-# We assigned a /24 per Location for "management" (257 Site possibles) <- Out of Band Access (out of /16)
-MANAGEMENT_POOL = IPv4Network("172.16.0.0/16").subnets(new_prefix=24)
-LOCATION_MGMTS = {location["shortname"]: next(MANAGEMENT_POOL) for location in site_locations}
-
 # Using RFC5735 TEST-NETs as external networks
 EXTERNAL_NETWORKS = [
     IPv4Network("203.0.113.0/24"),
     IPv4Network("192.0.2.0/24"),
     IPv4Network("198.51.100.0/24")
 ]
+
+# We assigned a /16 per Location for "data" (257 Site possibles)
+INTERNAL_POOL = IPv4Network("10.0.0.0/8")
+INTERNAL_POOL_PREFIXLEN = 16
+
+# We assigned a /24 per Location for "management" (257 Site possibles) <- Out of Band Access (out of /16)
+MANAGEMENT_POOL = IPv4Network("172.16.0.0/16")
+MANAGEMENT_POOL_PREFIXLEN = 24
+
 # We assigned one /28 per Location (48 Sites possibles)
-NETWORKS_POOL_EXTERNAL = [subnet for network in EXTERNAL_NETWORKS for subnet in network.subnets(new_prefix=28)]
-NETWORKS_POOL_ITER = iter(NETWORKS_POOL_EXTERNAL)
-LOCATION_EXTERNAL_NETS = {location["shortname"]: next(NETWORKS_POOL_ITER) for location in site_locations}
+EXTERNAL_POOL_PREFIXLEN = 28
+
+@lru_cache(maxsize=None)
+def get_external_networks_tree() -> PrefixTree:
+    tree = PrefixTree()
+    for network in EXTERNAL_NETWORKS:
+        tree.add(network)
+    return tree
+
+@lru_cache(maxsize=None)
+def get_site_locations() -> Tuple[Dict[str, str], ...]:
+    """Returns the locations of type 'site' (buildings), in declaration order."""
+    site_locations = []
+    for continent_name, continent_data in LOCATIONS.items():
+        for country_name, country_data in continent_data["countries"].items():
+            for region_name, region_data in country_data.get("regions", {}).items():
+                for metro_name, metro_data in region_data.get("metros", {}).items():
+                    for building_name, building_data in metro_data.get("buildings", {}).items():
+                        site_locations.append({"name": building_name, "shortname": building_data["shortname"]})
+    return tuple(site_locations)
+
+@lru_cache(maxsize=None)
+def get_site_indexes() -> Dict[str, int]:
+    """Returns the position of each site, used to carve its share of every pool."""
+    return {location["shortname"]: index for index, location in enumerate(get_site_locations())}
+
+def get_site_index(shortname: str) -> int:
+    if shortname not in get_site_indexes():
+        raise KeyError(f"{shortname} is not a site location")
+    return get_site_indexes()[shortname]
+
+@lru_cache(maxsize=None)
+def get_location_supernet(shortname: str) -> IPv4Network:
+    return get_subnet_by_index(INTERNAL_POOL, INTERNAL_POOL_PREFIXLEN, get_site_index(shortname))
+
+@lru_cache(maxsize=None)
+def get_location_mgmt(shortname: str) -> IPv4Network:
+    return get_subnet_by_index(MANAGEMENT_POOL, MANAGEMENT_POOL_PREFIXLEN, get_site_index(shortname))
+
+@lru_cache(maxsize=None)
+def get_location_external_net(shortname: str) -> IPv4Network:
+    index = get_site_index(shortname)
+    for network in EXTERNAL_NETWORKS:
+        subnets_count = 2 ** (EXTERNAL_POOL_PREFIXLEN - network.prefixlen)
+        if index < subnets_count:
+            return get_subnet_by_index(network, EXTERNAL_POOL_PREFIXLEN, index)
+        index -= subnets_count
+    raise ValueError(f"No external /{EXTERNAL_POOL_PREFIXLEN} left for {shortname}")
 
 VLANS = {
     ("100", "server-pxe"),
@@ -550,20 +588,58 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
 
     await create_location_hierarchy(client=client, branch=branch, log=log)
 
-    for location in site_locations:
+    # --------------------------------------------------
+    # Create Supernets (Phase 1)
+    # --------------------------------------------------
+    # Supernets of every site are created first so the child prefixes of phase 2 land under them
+    batch = await client.create_batch()
+    for location in get_site_locations():
+        location_name = location["name"]
+        location_shortname = location["shortname"]
+        location_supernet = get_location_supernet(location_shortname)
+        location_id = store.get(key=location_name, kind="LocationBuilding").id
+
+        supernet_description = f"{location_shortname.lower()}-supernet-{IPv4Network(location_supernet).network_address}"
+        data = {
+            "prefix":  {"value": location_supernet },
+            "description": {"value": supernet_description},
+            "organization": {"id": orga_duff_obj.id },
+            "location": {"id": location_id },
+            "status": {"value": "active" },
+            "role": {"value": "supernet" },
+        }
+        await create_and_add_to_batch(
+            client=client,
+            log=log,
+            branch=branch,
+            object_name=location_supernet,
+            kind_name="InfraPrefix",
+            data=data,
+            store=store,
+            batch=batch
+        )
+    async for node, _ in batch.execute():
+        accessor = f"{node._schema.default_filter.split('__')[0]}"
+        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
+
+    # --------------------------------------------------
+    # Create VLANs and Prefixes of every site (Phase 2)
+    # --------------------------------------------------
+    batch = await client.create_batch()
+    for location in get_site_locations():
         location_name = location["name"]
         location_shortname = location["shortname"]
 
         # We cut the prefixes attributed to the Location
-        location_supernet = LOCATION_SUPERNETS[location_shortname]
-        location_loopback_pool = list(location_supernet.subnets(new_prefix=24))[-1]
-        location_p2p_pool = list(location_supernet.subnets(new_prefix=24))[-2]
-        location_vtep_pool = list(location_supernet.subnets(new_prefix=24))[-3]
+        location_supernet = get_location_supernet(location_shortname)
+        location_loopback_pool = get_subnet_by_index(location_supernet, 24, -1)
+        location_p2p_pool = get_subnet_by_index(location_supernet, 24, -2)
+        location_vtep_pool = get_subnet_by_index(location_supernet, 24, -3)
 
-        location_mgmt_pool = LOCATION_MGMTS[location_shortname]
+        location_mgmt_pool = get_location_mgmt(location_shortname)
         # mgmt_address_pool = location_mgmt.hosts()
 
-        location_external_net = LOCATION_EXTERNAL_NETS[location_shortname]
+        location_external_net = get_location_external_net(location_shortname)
         location_prefixes = [
             location_external_net,
             location_loopback_pool,
@@ -575,7 +651,6 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
         # Create VLANs
         # --------------------------------------------------
         location_obj = store.get(key=location_name, kind="LocationBuilding")
-        batch = await client.create_batch()
         location_id = location_obj.id
         for vlan in VLANS:
             role = vlan[1].split("-")[0]
@@ -599,38 +674,14 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
                 store=store,
                 batch=batch
                 )
-        async for node, _ in batch.execute():
-            accessor = f"{node._schema.default_filter.split('__')[0]}"
-            log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
         # --------------------------------------------------
         # Create Prefix
         # --------------------------------------------------
-        # TODO Add a relation between the supernets and the smaller prefixes
-        batch = await client.create_batch()
-        # Create Supernet
-        supernet_description = f"{location_shortname.lower()}-supernet-{IPv4Network(location_supernet).network_address}"
-        data = {
-            "prefix":  {"value": location_supernet },
-            "description": {"value": supernet_description},
-            "organization": {"id": orga_duff_obj.id },
-            "location": {"id": location_id },
-            "status": {"value": "active" },
-            "role": {"value": "supernet" },
-        }
-        supernet_obj = await create_and_save(
-            client=client,
-            log=log,
-            branch=branch,
-            object_name=location_supernet,
-            kind_name="InfraPrefix",
-            data=data,
-            store=store
-        )
         # Create /24 specifics subnets Pool
         for prefix in location_prefixes:
             # vlan_id = None
-            if any(prefix.subnet_of(external_net) for external_net in EXTERNAL_NETWORKS):
+            if get_external_networks_tree().covers(prefix):
                 prefix_status = "active"
                 prefix_description = f"{location_shortname.lower()}-ext-{IPv4Network(prefix).network_address}"
                 prefix_role = "public"
@@ -662,7 +713,7 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
                 "vrf": { "id": vrf_id },
             }
 
-            prefix_obj = await create_and_add_to_batch(
+            await create_and_add_to_batch(
                 client=client,
                 log=log,
                 branch=branch,
@@ -672,9 +723,9 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
                 store=store,
                 batch=batch
                 )
-        async for node, _ in batch.execute():
-            accessor = f"{node._schema.default_filter.split('__')[0]}"
-            log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
+    async for node, _ in batch.execute():
+        accessor = f"{node._schema.default_filter.split('__')[0]}"
+        log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
 # ---------------------------------------------------------------
 # Use the `infrahubctl run` command line to execute this script
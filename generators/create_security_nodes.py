@@ -4,12 +4,11 @@ import logging
 
 from dataclasses import dataclass
 from enum import auto, Enum
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.node import InfrahubNode
-from infrahub_sdk.exceptions import NodeNotFoundError
 
 
 @dataclass
@@ -162,72 +161,86 @@ RULES = [
 ]
 
 
-async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
-    for ip_proto in IP_PROTOCOLS:
-        obj = await client.create(kind="SecurityIPProtocol", name=ip_proto.name, protocol=ip_proto.protocol, description=ip_proto.description)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for service in SERVICES:
-        proto = client.store.get(key=service.ip_protocol.name)
-        obj = await client.create(kind="SecurityService", name=service.name, description=service.description, ip_protocol=proto, port=service.port)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for service_group in SERVICE_GROUPS:
-        services = [client.store.get(service.name) for service in service_group.services]
-        obj = await client.create(kind="SecurityServiceGroup", name=service_group.name, services=services)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for prefix in PREFIXES:
-        obj = await client.create("SecurityPrefix", name=prefix.name, prefix=prefix.prefix)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for address in ADDRESSES:
-        obj = await client.create("SecurityIPAddress", name=address.name, address=address.address)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for address_group in ADDRESS_GROUPS:
-        addresses = [client.store.get(key=address.name) for address in address_group.addresses]
-        obj = await client.create(kind="SecurityAddressGroup", name=address_group.name, addresses=addresses)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for security_zone in SECURITY_ZONES:
-        obj = await client.create(kind="SecurityZone", name=security_zone.name)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    for policy in POLICIES:
-        obj = await client.create(kind="SecurityPolicy", name=policy.name)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    def store_get_or_none(key) -> Optional[InfrahubNode]:
+SecurityObject = Union[IPProtocol, Service, ServiceRange, ServiceGroup, SecurityPrefix, SecurityIPAddress, AddressGroup, SecurityZone, SecurityPolicy]
+
+def index_key(item: SecurityObject) -> Tuple[str, str]:
+    return (type(item).__name__, item.name)
+
+class SecurityNodeIndex:
+    """In-memory index of the nodes created from the dataclasses above, used to resolve references."""
+
+    def __init__(self) -> None:
+        self._nodes: Dict[Tuple[str, str], InfrahubNode] = {}
+
+    def set(self, item: SecurityObject, node: InfrahubNode) -> None:
+        self._nodes[index_key(item)] = node
+
+    def get(self, item: SecurityObject) -> InfrahubNode:
         try:
-            return client.store.get(key=key)
-        except NodeNotFoundError:
-            return None
+            return self._nodes[index_key(item)]
+        except KeyError:
+            raise ValueError(f"{type(item).__name__} {item.name} is referenced before being created") from None
+
+    def get_many(self, items: Optional[List[SecurityObject]]) -> Optional[List[InfrahubNode]]:
+        return [self.get(item) for item in items] if items else None
+
+async def save_level(client: InfrahubClient, log: logging.Logger, index: SecurityNodeIndex, objects: List[Tuple[SecurityObject, str, Dict[str, Any]]]) -> None:
+    """Saves the nodes of one dependency level in a single batch and indexes them."""
+    batch = await client.create_batch()
+    for item, kind, data in objects:
+        obj = await client.create(kind=kind, **data)
+        batch.add(task=obj.save, allow_upsert=True, node=obj)
+        index.set(item, obj)
+    async for node, _ in batch.execute():
+        log.debug(f"- Created {node._schema.kind} - {node.name.value}")
+    log.info(f"- Created {batch.num_tasks} objects ({', '.join(sorted({kind for _, kind, _ in objects}))})")
 
+async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
+    index = SecurityNodeIndex()
+
+    # Level 0: objects without references
+    level = []
+    level.extend((ip_proto, "SecurityIPProtocol", {"name": ip_proto.name, "protocol": ip_proto.protocol, "description": ip_proto.description}) for ip_proto in IP_PROTOCOLS)
+    level.extend((prefix, "SecurityPrefix", {"name": prefix.name, "prefix": prefix.prefix}) for prefix in PREFIXES)
+    level.extend((address, "SecurityIPAddress", {"name": address.name, "address": address.address}) for address in ADDRESSES)
+    level.extend((security_zone, "SecurityZone", {"name": security_zone.name}) for security_zone in SECURITY_ZONES)
+    level.extend((policy, "SecurityPolicy", {"name": policy.name}) for policy in POLICIES)
+    await save_level(client=client, log=log, index=index, objects=level)
+
+    # Level 1: services and address groups
+    level = []
+    level.extend((service, "SecurityService", {"name": service.name, "description": service.description, "ip_protocol": index.get(service.ip_protocol), "port": service.port}) for service in SERVICES)
+    level.extend((address_group, "SecurityAddressGroup", {"name": address_group.name, "addresses": index.get_many(address_group.addresses)}) for address_group in ADDRESS_GROUPS)
+    await save_level(client=client, log=log, index=index, objects=level)
+
+    # Level 2: service groups
+    level = [(service_group, "SecurityServiceGroup", {"name": service_group.name, "services": index.get_many(service_group.services)}) for service_group in SERVICE_GROUPS]
+    await save_level(client=client, log=log, index=index, objects=level)
+
+    # Level 3: rules
+    batch = await client.create_batch()
     for rule in RULES:
-        policy = store_get_or_none(rule.policy.name)
-        source_zone = store_get_or_none(rule.source_zone.name)
-        destination_zone = store_get_or_none(rule.destination_zone.name)
-        source_address = [store_get_or_none(address.name) for address in rule.source_addresses] if rule.source_addresses else None
-        source_groups = [store_get_or_none(group.name) for group in rule.source_groups] if rule.source_groups else None
-        source_services = [store_get_or_none(service.name) for service in rule.source_services] if rule.source_services else None
-        source_service_groups = [store_get_or_none(group.name) for group in rule.source_service_groups] if rule.source_service_groups else None
-        destination_address = [store_get_or_none(address.name) for address in rule.destination_addresses] if rule.destination_addresses else None
-        destination_groups = [store_get_or_none(group.name) for group in rule.destination_groups] if rule.destination_groups else None
-        destination_services = [store_get_or_none(service.name) for service in rule.destination_services] if rule.destination_services else None
-        destination_service_groups = [store_get_or_none(group.name) for group in rule.destination_service_groups] if rule.destination_service_groups else None
-        obj = await client.create(kind="SecurityPolicyRule",name=rule.name, policy=policy, index=rule.index, action=rule.action.name, source_zone=source_zone, destination_zone=destination_zone, source_address=source_address, source_groups=source_groups, source_services=source_services, source_service_groups=source_service_groups, destination_address=destination_address, destination_groups=destination_groups, destination_services=destination_services, destination_service_groups=destination_service_groups)
-
-        await obj.save(allow_upsert=True)
-
+        obj = await client.create(
+            kind="SecurityPolicyRule",
+            name=rule.name,
+            policy=index.get(rule.policy),
+            index=rule.index,
+            action=rule.action.name,
+            source_zone=index.get(rule.source_zone),
+            destination_zone=index.get(rule.destination_zone),
+            source_address=index.get_many(rule.source_addresses),
+            source_groups=index.get_many(rule.source_groups),
+            source_services=index.get_many(rule.source_services),
+            source_service_groups=index.get_many(rule.source_service_groups),
+            destination_address=index.get_many(rule.destination_addresses),
+            destination_groups=index.get_many(rule.destination_groups),
+            destination_services=index.get_many(rule.destination_services),
+            destination_service_groups=index.get_many(rule.destination_service_groups),
+        )
+        batch.add(task=obj.save, allow_upsert=True, node=obj)
+    async for node, _ in batch.execute():
+        log.debug(f"- Created {node._schema.kind} - {node.name.value}")
+    log.info(f"- Created {batch.num_tasks} objects (SecurityPolicyRule)")
 
     manufacturer = await client.get("OrganizationManufacturer", name__value="Juniper")
     platform = await client.get("InfraPlatform", name__value="Juniper JunOS")
@@ -255,8 +268,9 @@ async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
 
     interfaces = [("ge-0/0/1", "outside", "10.0.1.1/24"), ("ge-0/0/2", "inside", "10.0.2.1/24"),("ge-0/0/3", "dmz", "10.0.3.1/24")]
 
+    zones = {security_zone.name: security_zone for security_zone in SECURITY_ZONES}
     for (interface, zone, ip) in interfaces:
-        security_zone = store_get_or_none(zone)
+        security_zone = index.get(zones[zone])
 
         firewall_interface = await client.create(kind="SecurityFirewallInterface", name=interface, speed=1_000_000, security_zone=security_zone, device=device)
         await firewall_interface.save(allow_upsert=True)
@@ -268,5 +282,5 @@ async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
         firewall_interface.ip_addresses.add(ip_address)
         await firewall_interface.save(allow_upsert=True)
 
-    device.policy = store_get_or_none(FRA_FW1_POLICY.name)
+    device.policy = index.get(FRA_FW1_POLICY)
     await device.save()
@@ -9,7 +9,7 @@ from infrahub_sdk.store import NodeStore
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.uuidt import UUIDT
 
-from utils import create_and_save, populate_local_store
+from utils import PrefixTree, create_and_save, get_subnet_by_index, populate_local_store
 
 
 # flake8: noqa
@@ -75,7 +75,6 @@ async def generate_network_services(
 
     location_supernet = None
     remaining_prefixes = []
-    existing_prefixes = 0
     for locations_subnet in locations_subnets:
         if locations_subnet.role.value == "supernet":
             location_supernet = locations_subnet
@@ -87,12 +86,13 @@ async def generate_network_services(
     # FIXME
     # Replace Section when we have Ressource Manager
         else:
-            for locations_subnet in locations_subnets:
-                if locations_subnet.role.value in ("server"):
-                    existing_prefixes += 1
-            all_prefixes = list(IPv4Network(location_supernet.prefix.value).subnets(new_prefix=24))
-            remaining_prefixes = all_prefixes[existing_prefixes:]
-            if len(remaining_prefixes) < 4:
+            # The first /24 of the supernet is kept aside, the others are free unless a prefix already sits in them
+            locations_subnets_tree = PrefixTree.from_prefix_nodes(locations_subnets)
+            first_prefix = get_subnet_by_index(IPv4Network(location_supernet.prefix.value), 24, 0)
+            remaining_prefixes = [
+                prefix for prefix in locations_subnets_tree.free_subnets(location_supernet.prefix.value, new_prefix=24) if prefix != first_prefix
+            ]
+            if len(remaining_prefixes) < 3:
                 log.error(f"The number of prefixes still available in {location_supernet.prefix.value} doesn't allow to create the requested services")
                 return None
     locations_vlans = await client.filters(kind="InfraVLAN", location__ids=[location_id], branch=branch, populate_store=True)
@@ -103,7 +103,7 @@ async def generate_network_services(
     existing_services = [identifier for identifier in service_identifiers if int(identifier.identifier.value) // 100 == identifier_prefix_to_match]
 
     # Debug helper
-    log.debug(f"Number of existing Prefixes = {existing_prefixes}")
+    log.debug(f"Number of available Prefixes = {len(remaining_prefixes)}")
     log.debug(f"Number of existing Vlans = {len(existing_vlans)}")
     log.debug(f"Number of existing Services = {len(existing_services)}")
 
@@ -161,7 +161,7 @@ async def generate_network_services(
         # Create Prefix
         prefix_obj = None
         if service_type.title() == "Layer3":
-            prefix_prefix = previous_prefix if previous_prefix else remaining_prefixes[1]
+            prefix_prefix = previous_prefix if previous_prefix else remaining_prefixes[0]
             prefix_description = f"{location_shortname.lower()}-server-{IPv4Network(prefix_prefix).network_address}"
             prefix_data = {
                 "prefix": { "value": prefix_prefix, "is_protected": True, "source": account_pop.id },
@@ -0,0 +1,397 @@
+import csv
+import logging
+
+from dataclasses import dataclass
+from ipaddress import IPv4Network, ip_network
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import yaml
+
+from infrahub_sdk import InfrahubClient
+from infrahub_sdk.batch import InfrahubBatch
+from infrahub_sdk.node import InfrahubNode
+from infrahub_sdk.store import NodeStore
+
+from utils import PrefixTree, populate_local_store
+
+# flake8: noqa
+# pylint: skip-file
+
+#   ---  Location inventory file  ---
+#
+#   One record per location, parents before children. Records are read one at a time
+#   so the file can hold any number of locations.
+#
+#   CSV: a header line, then one location per line
+#       kind,name,shortname,parent,description,timezone,facility_id,owner
+#       continent,Europe,EU,,,GMT+1,,
+#       building,Equinix FRA05,FRA05,FRA,,,eqx-fra05,Equinix
+#
+#   YAML: one record per document (or a list of records per document)
+#       ---
+#       kind: continent
+#       name: Europe
+#       shortname: EU
+#
+#   `parent` is the shortname of a location declared earlier in the file or already
+#   present in Infrahub. Files ordered level by level (all continents, then all countries, ...)
+#   give the largest batches.
+#
+#   Site subnets are taken from the parts of the pools no existing prefix uses, a site which
+#   already has a supernet or a management prefix keeps it, so the import can be run again.
+
+LOCATION_KINDS = {
+    "continent": "LocationContinent",
+    "country": "LocationCountry",
+    "region": "LocationRegion",
+    "metro": "LocationMetro",
+    "building": "LocationBuilding",
+    "floor": "LocationFloor",
+    "suite": "LocationSuite",
+    "rack": "LocationRack",
+}
+
+PARENT_KINDS = {
+    "LocationContinent": None,
+    "LocationCountry": "LocationContinent",
+    "LocationRegion": "LocationCountry",
+    "LocationMetro": "LocationRegion",
+    "LocationBuilding": "LocationMetro",
+    "LocationFloor": "LocationBuilding",
+    "LocationSuite": "LocationFloor",
+    "LocationRack": "LocationSuite",
+}
+
+# Only these kinds have an `owner` and a `facility_id`
+OWNED_KINDS = ("LocationBuilding", "LocationSuite", "LocationRack")
+
+# Buildings are the "sites" receiving a data supernet and a management /24
+SITE_KIND = "LocationBuilding"
+
+SUPERNET_POOL = "10.0.0.0/8"
+SUPERNET_PREFIXLEN = 16
+MANAGEMENT_POOL = "172.16.0.0/12"
+MANAGEMENT_PREFIXLEN = 24
+
+CHUNK_SIZE = 500
+PAGE_SIZE = 500
+
+ACTIVE_STATUS = "active"
+
+store = NodeStore()
+
+EXISTING_PREFIXES_QUERY = """
+query ExistingPrefixes($offset: Int, $limit: Int) {
+  InfraPrefix(offset: $offset, limit: $limit) {
+    count
+    edges {
+      node {
+        prefix { value }
+        role { value }
+        location { node { id } }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class LocationRecord:
+    kind: str
+    name: str
+    shortname: str
+    parent: Optional[str] = None
+    description: Optional[str] = None
+    timezone: Optional[str] = None
+    facility_id: Optional[str] = None
+    owner: Optional[str] = None
+
+
+class SitePools:
+    """Allocates the site subnets from the parts of the pools not overlapping an existing prefix."""
+
+    def __init__(
+        self,
+        supernet_pool: IPv4Network,
+        supernet_prefixlen: int,
+        management_pool: IPv4Network,
+        management_prefixlen: int,
+        existing: Optional[PrefixTree] = None,
+        site_roles: Optional[Dict[str, Set[str]]] = None,
+    ) -> None:
+        existing = existing or PrefixTree()
+        # role -> (pool, free subnets of the pool)
+        self.pools = {
+            "supernet": (supernet_pool, existing.free_subnets(supernet_pool, new_prefix=supernet_prefixlen)),
+            "management": (management_pool, existing.free_subnets(management_pool, new_prefix=management_prefixlen)),
+        }
+        # location id -> roles of the prefixes the location already has
+        self.site_roles = site_roles or {}
+
+    def allocate(self, role: str) -> IPv4Network:
+        pool, subnets = self.pools[role]
+        subnet = next(subnets, None)
+        if subnet is None:
+            raise IndexError(f"No free subnet left in the {role} pool {pool}")
+        return subnet
+
+
+async def load_site_pools(client: InfrahubClient, branch: str, **pools) -> SitePools:
+    """Reads the existing prefixes overlapping the pools, page by page, and returns pools skipping them."""
+    networks = [pools["supernet_pool"], pools["management_pool"]]
+    existing = PrefixTree()
+    site_roles: Dict[str, Set[str]] = {}
+    offset = 0
+    while True:
+        response = await client.execute_graphql(
+            query=EXISTING_PREFIXES_QUERY, variables={"offset": offset, "limit": PAGE_SIZE}, branch_name=branch
+        )
+        page = response["InfraPrefix"]
+        for edge in page["edges"]:
+            prefix = ip_network(edge["node"]["prefix"]["value"])
+            if prefix.version == 4 and any(prefix.overlaps(network) for network in networks):
+                existing.add(prefix)
+            location = (edge["node"].get("location") or {}).get("node")
+            role = (edge["node"].get("role") or {}).get("value")
+            if location and role:
+                site_roles.setdefault(location["id"], set()).add(role)
+        offset += PAGE_SIZE
+        if offset >= page["count"] or not page["edges"]:
+            break
+
+    return SitePools(existing=existing, site_roles=site_roles, **pools)
+
+
+def read_location_rows(path: Path) -> Iterator[Dict[str, str]]:
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="") as file:
+            yield from csv.DictReader(file)
+    elif path.suffix.lower() in (".yml", ".yaml"):
+        with open(path) as file:
+            for document in yaml.safe_load_all(file):
+                if isinstance(document, list):
+                    yield from document
+                elif document:
+                    yield document
+    else:
+        raise ValueError(f"Unsupported location file format {path.suffix}, use .csv, .yml or .yaml")
+
+
+def parse_location_record(row: Dict[str, str], line: int) -> LocationRecord:
+    kind = LOCATION_KINDS.get(str(row.get("kind") or "").strip().lower())
+    if not kind:
+        raise ValueError(f"Record {line}: unknown location kind {row.get('kind')!r}")
+    for field in ("name", "shortname"):
+        if not row.get(field):
+            raise ValueError(f"Record {line}: missing {field}")
+    return LocationRecord(
+        kind=kind,
+        name=str(row["name"]),
+        shortname=str(row["shortname"]),
+        parent=str(row["parent"]) if row.get("parent") else None,
+        description=row.get("description") or None,
+        timezone=row.get("timezone") or None,
+        facility_id=row.get("facility_id") or None,
+        owner=row.get("owner") or None,
+    )
+
+
+class LocationImporter:
+    """Writes location records in chunked batches, allocating pools to each site."""
+
+    def __init__(
+        self,
+        client: InfrahubClient,
+        log: logging.Logger,
+        branch: str,
+        pools: SitePools,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        self.client = client
+        self.log = log
+        self.branch = branch
+        self.pools = pools
+        self.chunk_size = chunk_size
+        # shortname -> (kind, id) of every location seen so far, this is the only state growing with the file
+        self.index: Dict[str, Tuple[str, str]] = {}
+        self.pending: Dict[str, InfrahubNode] = {}
+        self.pending_sites: List[Tuple[InfrahubNode, LocationRecord]] = []
+        self.locations_batch: Optional[InfrahubBatch] = None
+        self.prefixes_batch: Optional[InfrahubBatch] = None
+        self.created_locations = 0
+        self.created_prefixes = 0
+
+    async def resolve_parent(self, record: LocationRecord) -> Optional[str]:
+        expected_kind = PARENT_KINDS[record.kind]
+        if not expected_kind:
+            if record.parent:
+                raise ValueError(f"{record.shortname}: a {record.kind} can't have a parent")
+            return None
+        if not record.parent:
+            raise ValueError(f"{record.shortname}: a {record.kind} requires a {expected_kind} parent")
+
+        if record.parent in self.pending:
+            await self.flush_locations()
+        if record.parent not in self.index:
+            existing = await self.client.get(
+                kind="LocationGeneric", shortname__value=record.parent, branch=self.branch, raise_when_missing=False
+            )
+            if existing:
+                self.index[record.parent] = (existing.get_kind(), existing.id)
+
+        if record.parent not in self.index:
+            raise ValueError(f"{record.shortname}: parent {record.parent} is neither declared earlier nor present in Infrahub")
+        parent_kind, parent_id = self.index[record.parent]
+        if parent_kind != expected_kind:
+            raise ValueError(f"{record.shortname}: parent {record.parent} is a {parent_kind}, expected a {expected_kind}")
+        return parent_id
+
+    async def add(self, record: LocationRecord) -> None:
+        if record.shortname in self.index or record.shortname in self.pending:
+            raise ValueError(f"{record.shortname} is declared more than once")
+
+        account_crm = store.get(key="CRM Synchronization", kind="CoreAccount")
+        data = {
+            "name": {"value": record.name, "is_protected": True, "source": account_crm.id},
+            "description": {"value": record.description or f"{record.kind[len('Location'):]} {record.name.lower()}"},
+            "shortname": record.shortname,
+            "parent": await self.resolve_parent(record),
+        }
+        if record.timezone:
+            data["timezone"] = record.timezone
+        if record.kind in OWNED_KINDS:
+            if record.facility_id:
+                data["facility_id"] = record.facility_id
+            if record.owner:
+                owner = store.get(key=record.owner, raise_when_missing=False)
+                if not owner or not owner.get_kind().startswith("Organization"):
+                    raise ValueError(f"{record.shortname}: unknown owner organization {record.owner}")
+                data["owner"] = owner.id
+
+        if not self.locations_batch:
+            self.locations_batch = await self.client.create_batch()
+        obj = await self.client.create(branch=self.branch, kind=record.kind, data=data)
+        self.locations_batch.add(task=obj.save, allow_upsert=True, node=obj)
+        self.pending[record.shortname] = obj
+        if record.kind == SITE_KIND:
+            self.pending_sites.append((obj, record))
+
+        if self.locations_batch.num_tasks >= self.chunk_size:
+            await self.flush_locations()
+
+    async def flush_locations(self) -> None:
+        if not self.locations_batch:
+            return
+        async for node, _ in self.locations_batch.execute():
+            self.created_locations += 1
+            self.log.debug(f"- Created {node._schema.kind} - {node.shortname.value}")
+        for shortname, node in self.pending.items():
+            self.index[shortname] = (node.get_kind(), node.id)
+        self.log.info(f"- Created {len(self.pending)} locations ({self.created_locations} so far)")
+        self.locations_batch = None
+        self.pending = {}
+
+        sites, self.pending_sites = self.pending_sites, []
+        for site, record in sites:
+            await self.add_site_prefixes(site=site, record=record)
+
+    async def add_site_prefixes(self, site: InfrahubNode, record: LocationRecord) -> None:
+        orga_duff_obj = store.get(key="Duff", kind="OrganizationTenant")
+        existing_roles = self.pools.site_roles.get(site.id, set())
+        prefixes = []
+        if "supernet" not in existing_roles:
+            supernet = self.pools.allocate("supernet")
+            prefixes.append((supernet, f"{record.shortname.lower()}-supernet-{supernet.network_address}", "supernet", None))
+        if "management" not in existing_roles:
+            management = self.pools.allocate("management")
+            prefixes.append((management, f"{record.shortname.lower()}-mgmt-{management.network_address}", "management", store.get(key="Management", kind="InfraVRF").id))
+        if not prefixes:
+            return
+        if not self.prefixes_batch:
+            self.prefixes_batch = await self.client.create_batch()
+        for prefix, description, role, vrf_id in prefixes:
+            data = {
+                "prefix": {"value": prefix},
+                "description": {"value": description},
+                "organization": {"id": orga_duff_obj.id},
+                "location": {"id": site.id},
+                "status": {"value": ACTIVE_STATUS},
+                "role": {"value": role},
+            }
+            if vrf_id:
+                data["vrf"] = {"id": vrf_id}
+            obj = await self.client.create(branch=self.branch, kind="InfraPrefix", data=data)
+            self.prefixes_batch.add(task=obj.save, allow_upsert=True, node=obj)
+
+        if self.prefixes_batch.num_tasks >= self.chunk_size:
+            await self.flush_prefixes()
+
+    async def flush_prefixes(self) -> None:
+        if not self.prefixes_batch:
+            return
+        async for _, _ in self.prefixes_batch.execute():
+            self.created_prefixes += 1
+        self.log.info(f"- Created prefixes ({self.created_prefixes} so far)")
+        self.prefixes_batch = None
+
+    async def flush(self) -> None:
+        await self.flush_locations()
+        await self.flush_prefixes()
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run generators/import_locations.py file=locations.csv
+#
+#   Optional: supernet_pool=10.0.0.0/8 supernet_prefixlen=16
+#             management_pool=172.16.0.0/12 management_prefixlen=24 chunk_size=500
+#
+# ---------------------------------------------------------------
+async def run(client: InfrahubClient, log: logging.Logger, branch: str, **kwargs) -> None:
+    if "file" not in kwargs:
+        log.error("No location file indicated, use file=<path>")
+        exit(1)
+
+    log.info("Retrieving objects from Infrahub")
+    try:
+        accounts = await client.all("CoreAccount")
+        populate_local_store(objects=accounts, key_type="name", store=store)
+        organizations = await client.all("OrganizationGeneric")
+        populate_local_store(objects=organizations, key_type="name", store=store)
+        vrfs = await client.all("InfraVRF")
+        populate_local_store(objects=vrfs, key_type="name", store=store)
+    except Exception as e:
+        log.error(f"Fail to populate due to {e}")
+        exit(1)
+
+    pools = await load_site_pools(
+        client,
+        branch,
+        supernet_pool=IPv4Network(kwargs.get("supernet_pool", SUPERNET_POOL)),
+        supernet_prefixlen=int(kwargs.get("supernet_prefixlen", SUPERNET_PREFIXLEN)),
+        management_pool=IPv4Network(kwargs.get("management_pool", MANAGEMENT_POOL)),
+        management_prefixlen=int(kwargs.get("management_prefixlen", MANAGEMENT_PREFIXLEN)),
+    )
+    importer = LocationImporter(
+        client=client,
+        log=log,
+        branch=branch,
+        pools=pools,
+        chunk_size=int(kwargs.get("chunk_size", CHUNK_SIZE)),
+    )
+
+    path = Path(kwargs["file"])
+    log.info(f"Importing locations from {path}")
+    try:
+        for line, row in enumerate(read_location_rows(path), start=1):
+            await importer.add(parse_location_record(row=row, line=line))
+        await importer.flush()
+    except (ValueError, IndexError) as exc:
+        await importer.flush()
+        log.error(f"Import stopped: {exc}")
+        exit(1)
+
+    log.info(f"Imported {importer.created_locations} locations and {importer.created_prefixes} prefixes")
@@ -0,0 +1,340 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from ipaddress import ip_interface, ip_network
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# flake8: noqa
+# pylint: skip-file
+
+#   ---  Policy compiler  ---
+#
+#   Expands the address, service and group objects referenced by policy rules into
+#   interval sets, so that two rules can be compared without looking at the names.
+#
+#   - IPv4 and IPv6 addresses share one integer space, IPv6 being shifted above IPv4
+#   - Ports are kept per IP protocol number, a bare protocol matches every port
+#   - An address with a prefix length (0.0.0.0/0) matches its whole network, like on the SRX
+#   - An IP protocol without protocol number ("IP") matches any service
+#   - Objects that can't be expanded (FQDN, unknown ids) are kept as opaque tokens
+#     which only cover themselves
+#   - A rule without address (or service) matches any address (or service)
+#   - A rule covered by an earlier rule with the same action is left out, covered by an earlier
+#     rule with another action it is kept and reported as a conflict
+
+IPV6_OFFSET = 1 << 32
+MAX_PORT = 65535
+
+POLICY_OBJECTS_QUERY = """
+query PolicyObjects {
+  SecurityGenericAddress {
+    edges {
+      node {
+        id
+        __typename
+        ... on SecurityIPAddress { address { value } }
+        ... on SecurityPrefix { prefix { value } }
+        ... on SecurityIPRange { start { value } end { value } }
+        ... on SecurityFQDN { fqdn { value } }
+        ... on SecurityIPAMIPAddress { ip_address { node { ... on InfraIPAddress { address { value } } } } }
+        ... on SecurityIPAMIPPrefix { ip_prefix { node { ... on InfraPrefix { prefix { value } } } } }
+      }
+    }
+  }
+  SecurityGenericAddressGroup {
+    edges {
+      node {
+        id
+        addresses { edges { node { id } } }
+      }
+    }
+  }
+  SecurityGenericService {
+    edges {
+      node {
+        id
+        __typename
+        ... on SecurityIPProtocol { protocol { value } }
+        ... on SecurityService { port { value } ip_protocol { node { protocol { value } } } }
+        ... on SecurityServiceRange { start { value } end { value } ip_protocol { node { protocol { value } } } }
+      }
+    }
+  }
+  SecurityGenericServiceGroup {
+    edges {
+      node {
+        id
+        services { edges { node { id } } }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass(frozen=True)
+class IntervalSet:
+    """Sorted, merged and inclusive (start, end) integer intervals."""
+
+    intervals: Tuple[Tuple[int, int], ...] = ()
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[Tuple[int, int]]) -> "IntervalSet":
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return cls(tuple(merged))
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals)
+
+    def __or__(self, other: "IntervalSet") -> "IntervalSet":
+        return IntervalSet.from_intervals(self.intervals + other.intervals)
+
+    def contains(self, value: int) -> bool:
+        position = bisect_right(self.intervals, (value, float("inf"))) - 1
+        return position >= 0 and self.intervals[position][1] >= value
+
+    def covers(self, other: "IntervalSet") -> bool:
+        """Returns True when every value of `other` is in this set."""
+        starts = [start for start, _ in self.intervals]
+        for start, end in other.intervals:
+            position = bisect_right(starts, start) - 1
+            if position < 0 or self.intervals[position][1] < end:
+                return False
+        return True
+
+
+@dataclass(frozen=True)
+class AddressMatch:
+    any: bool = False
+    addresses: IntervalSet = IntervalSet()
+    opaque: FrozenSet[str] = frozenset()
+
+    def __or__(self, other: "AddressMatch") -> "AddressMatch":
+        return AddressMatch(
+            any=self.any or other.any, addresses=self.addresses | other.addresses, opaque=self.opaque | other.opaque
+        )
+
+    def covers(self, other: "AddressMatch") -> bool:
+        if self.any:
+            return True
+        if other.any:
+            return False
+        return self.addresses.covers(other.addresses) and other.opaque <= self.opaque
+
+
+@dataclass(frozen=True)
+class ServiceMatch:
+    any: bool = False
+    # IP protocol number -> destination ports
+    ports: Tuple[Tuple[int, IntervalSet], ...] = ()
+    opaque: FrozenSet[str] = frozenset()
+
+    def __or__(self, other: "ServiceMatch") -> "ServiceMatch":
+        ports = dict(self.ports)
+        for protocol, interval_set in other.ports:
+            ports[protocol] = ports[protocol] | interval_set if protocol in ports else interval_set
+        return ServiceMatch(
+            any=self.any or other.any, ports=tuple(sorted(ports.items())), opaque=self.opaque | other.opaque
+        )
+
+    def covers(self, other: "ServiceMatch") -> bool:
+        if self.any:
+            return True
+        if other.any:
+            return False
+        ports = dict(self.ports)
+        for protocol, interval_set in other.ports:
+            if protocol not in ports or not ports[protocol].covers(interval_set):
+                return False
+        return other.opaque <= self.opaque
+
+
+@dataclass
+class ObjectCatalog:
+    """Expanded form of every address, service and group, by id."""
+
+    addresses: Dict[str, AddressMatch] = field(default_factory=dict)
+    address_groups: Dict[str, List[str]] = field(default_factory=dict)
+    services: Dict[str, ServiceMatch] = field(default_factory=dict)
+    service_groups: Dict[str, List[str]] = field(default_factory=dict)
+
+    def expand_addresses(self, address_ids: Iterable[str], group_ids: Iterable[str]) -> AddressMatch:
+        address_ids = list(address_ids)
+        group_ids = list(group_ids)
+        if not address_ids and not group_ids:
+            return AddressMatch(any=True)
+        for group_id in group_ids:
+            if group_id in self.address_groups:
+                address_ids.extend(self.address_groups[group_id])
+            else:
+                address_ids.append(group_id)
+        match = AddressMatch()
+        for address_id in address_ids:
+            match = match | self.addresses.get(address_id, AddressMatch(opaque=frozenset([address_id])))
+        return match
+
+    def expand_services(self, service_ids: Iterable[str], group_ids: Iterable[str]) -> ServiceMatch:
+        service_ids = list(service_ids)
+        group_ids = list(group_ids)
+        if not service_ids and not group_ids:
+            return ServiceMatch(any=True)
+        for group_id in group_ids:
+            if group_id in self.service_groups:
+                service_ids.extend(self.service_groups[group_id])
+            else:
+                service_ids.append(group_id)
+        match = ServiceMatch()
+        for service_id in service_ids:
+            match = match | self.services.get(service_id, ServiceMatch(opaque=frozenset([service_id])))
+        return match
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: str
+    name: str
+    action: str
+    source_zone: str
+    destination_zone: str
+    source: AddressMatch
+    destination: AddressMatch
+    services: ServiceMatch
+
+    def covers(self, other: "CompiledRule") -> bool:
+        """Returns True when every flow matching `other` also matches this rule."""
+        return (
+            self.source_zone == other.source_zone
+            and self.destination_zone == other.destination_zone
+            and self.source.covers(other.source)
+            and self.destination.covers(other.destination)
+            and self.services.covers(other.services)
+        )
+
+
+@dataclass(frozen=True)
+class EliminatedRule:
+    rule: CompiledRule
+    covered_by: CompiledRule
+
+
+@dataclass(frozen=True)
+class RuleConflict:
+    """A rule which can never match because an earlier rule with another action covers it."""
+
+    rule: CompiledRule
+    covered_by: CompiledRule
+
+
+def network_to_interval(prefix: str) -> Tuple[int, int]:
+    network = ip_network(prefix, strict=False)
+    offset = IPV6_OFFSET if network.version == 6 else 0
+    return offset + int(network.network_address), offset + int(network.broadcast_address)
+
+
+def host_to_interval(start: str, end: Optional[str] = None) -> Tuple[int, int]:
+    first = ip_interface(start).ip
+    last = ip_interface(end).ip if end else first
+    offset = IPV6_OFFSET if first.version == 6 else 0
+    return offset + int(first), offset + int(last)
+
+
+def address_to_interval(address: str) -> Tuple[int, int]:
+    # IPHost values may carry a prefix length, the SRX matches the whole network (ANY is 0.0.0.0/0)
+    if "/" in address:
+        return network_to_interval(str(ip_interface(address).network))
+    return host_to_interval(address)
+
+
+def extract_value(node: dict, name: str) -> Optional[str]:
+    return (node.get(name) or {}).get("value")
+
+
+def extract_protocol(node: dict) -> Optional[int]:
+    ip_protocol = node.get("ip_protocol") or {}
+    if not ip_protocol.get("node"):
+        return None
+    return ip_protocol["node"]["protocol"]["value"]
+
+
+def compile_address(node: dict) -> AddressMatch:
+    kind = node["__typename"]
+    interval = None
+    if kind == "SecurityIPAddress" and extract_value(node, "address"):
+        interval = address_to_interval(extract_value(node, "address"))
+    elif kind == "SecurityPrefix" and extract_value(node, "prefix"):
+        interval = network_to_interval(extract_value(node, "prefix"))
+    elif kind == "SecurityIPRange" and extract_value(node, "start") and extract_value(node, "end"):
+        interval = host_to_interval(extract_value(node, "start"), extract_value(node, "end"))
+    elif kind == "SecurityIPAMIPAddress" and (node.get("ip_address") or {}).get("node"):
+        interval = address_to_interval(extract_value(node["ip_address"]["node"], "address"))
+    elif kind == "SecurityIPAMIPPrefix" and (node.get("ip_prefix") or {}).get("node"):
+        interval = network_to_interval(extract_value(node["ip_prefix"]["node"], "prefix"))
+    if interval:
+        return AddressMatch(addresses=IntervalSet.from_intervals([interval]))
+    return AddressMatch(opaque=frozenset([node["id"]]))
+
+
+def compile_service(node: dict) -> ServiceMatch:
+    kind = node["__typename"]
+    if kind == "SecurityIPProtocol":
+        # Without protocol number the object stands for any IP traffic
+        if extract_value(node, "protocol") is None:
+            return ServiceMatch(any=True)
+        ports = IntervalSet.from_intervals([(0, MAX_PORT)])
+        return ServiceMatch(ports=((int(extract_value(node, "protocol")), ports),))
+    protocol = extract_protocol(node)
+    if protocol is not None:
+        if kind == "SecurityService" and extract_value(node, "port") is not None:
+            port = int(extract_value(node, "port"))
+            return ServiceMatch(ports=((protocol, IntervalSet.from_intervals([(port, port)])),))
+        if kind == "SecurityServiceRange" and extract_value(node, "start") is not None:
+            ports = IntervalSet.from_intervals([(int(extract_value(node, "start")), int(extract_value(node, "end")))])
+            return ServiceMatch(ports=((protocol, ports),))
+    return ServiceMatch(opaque=frozenset([node["id"]]))
+
+
+def build_object_catalog(data: dict) -> ObjectCatalog:
+    """Builds the catalog from the response of POLICY_OBJECTS_QUERY."""
+    catalog = ObjectCatalog()
+    for edge in data["SecurityGenericAddress"]["edges"]:
+        catalog.addresses[edge["node"]["id"]] = compile_address(edge["node"])
+    for edge in data["SecurityGenericAddressGroup"]["edges"]:
+        catalog.address_groups[edge["node"]["id"]] = [
+            address["node"]["id"] for address in edge["node"]["addresses"]["edges"]
+        ]
+    for edge in data["SecurityGenericService"]["edges"]:
+        catalog.services[edge["node"]["id"]] = compile_service(edge["node"])
+    for edge in data["SecurityGenericServiceGroup"]["edges"]:
+        catalog.service_groups[edge["node"]["id"]] = [
+            service["node"]["id"] for service in edge["node"]["services"]["edges"]
+        ]
+    return catalog
+
+
+def eliminate_covered_rules(
+    rules: List[CompiledRule],
+) -> Tuple[List[CompiledRule], List[EliminatedRule], List[RuleConflict]]:
+    """Drops the rules fully covered by a single earlier rule with the same action, the order of the others is kept.
+
+    A rule covered by an earlier rule with another action is kept and returned as a conflict.
+    """
+    kept: List[CompiledRule] = []
+    eliminated: List[EliminatedRule] = []
+    conflicts: List[RuleConflict] = []
+    kept_by_zone_pair: Dict[Tuple[str, str], List[CompiledRule]] = {}
+    for rule in rules:
+        earlier_rules = kept_by_zone_pair.setdefault((rule.source_zone, rule.destination_zone), [])
+        # The first covering rule is the one matching the flows of this rule
+        covered_by = next((earlier for earlier in earlier_rules if earlier.covers(rule)), None)
+        if covered_by and covered_by.action == rule.action:
+            eliminated.append(EliminatedRule(rule=rule, covered_by=covered_by))
+            continue
+        if covered_by:
+            conflicts.append(RuleConflict(rule=rule, covered_by=covered_by))
+        earlier_rules.append(rule)
+        kept.append(rule)
+    return kept, eliminated, conflicts
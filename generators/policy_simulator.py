@@ -0,0 +1,354 @@
+import csv
+import logging
+
+from collections import Counter
+from dataclasses import dataclass
+from ipaddress import ip_address, ip_interface
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from infrahub_sdk import InfrahubClient
+
+from policy_compiler import (
+    IPV6_OFFSET,
+    POLICY_OBJECTS_QUERY,
+    AddressMatch,
+    CompiledRule,
+    IntervalSet,
+    ObjectCatalog,
+    ServiceMatch,
+    build_object_catalog,
+)
+from utils import PrefixTree
+
+# flake8: noqa
+# pylint: skip-file
+
+#   ---  Policy flow simulator  ---
+#
+#   Answers "which rendered rule matches this flow on firewall X" without touching the device.
+#
+#   The rendered rules of the firewall are compiled once into sorted interval arrays (addresses
+#   and ports per protocol), then batches of IPv4 flows are evaluated with numpy: each rule only
+#   looks at the flows no earlier rule matched. IPv6 flows go through `evaluate_flow`.
+#
+#   When a flow doesn't carry its zones, they are taken from the firewall interface whose subnet
+#   contains the address (longest match).
+
+NO_MATCH = "no-match"
+
+DEVICE_RULES_QUERY = """
+query DevicePolicyRules($device: String!) {
+  SecurityFirewall(name__value: $device) {
+    edges {
+      node {
+        id
+        rules {
+          edges {
+            node {
+              id
+              index { value }
+              name { value }
+              action { value }
+              source_zone { node { id name { value } } }
+              destination_zone { node { id name { value } } }
+              source_address { edges { node { id } } }
+              source_groups { edges { node { id } } }
+              destination_address { edges { node { id } } }
+              destination_groups { edges { node { id } } }
+              destination_services { edges { node { id } } }
+              destination_service_groups { edges { node { id } } }
+            }
+          }
+        }
+        interfaces {
+          edges {
+            node {
+              ... on SecurityFirewallInterface {
+                security_zone { node { name { value } } }
+                ip_addresses { edges { node { address { value } } } }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class SimulatedRule:
+    index: int
+    rule: CompiledRule
+    # IPv4 part of the address sets as (starts, ends) arrays, None matches any address
+    source: Optional[Tuple[np.ndarray, np.ndarray]]
+    destination: Optional[Tuple[np.ndarray, np.ndarray]]
+    # IP protocol number -> (starts, ends) of the destination ports, None matches any service
+    services: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]]
+
+
+def to_arrays(interval_set: IntervalSet, upper_bound: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    intervals = [
+        (start, min(end, upper_bound - 1) if upper_bound else end)
+        for start, end in interval_set.intervals
+        if not upper_bound or start < upper_bound
+    ]
+    starts = np.array([start for start, _ in intervals], dtype=np.uint64)
+    ends = np.array([end for _, end in intervals], dtype=np.uint64)
+    return starts, ends
+
+
+def address_arrays(match: AddressMatch) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    # Opaque addresses (FQDN) can't be matched against an IP and are left out
+    if match.any:
+        return None
+    return to_arrays(match.addresses, upper_bound=IPV6_OFFSET)
+
+
+def service_arrays(match: ServiceMatch) -> Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]]:
+    if match.any:
+        return None
+    return {protocol: to_arrays(ports) for protocol, ports in match.ports}
+
+
+def in_intervals(values: np.ndarray, intervals: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    starts, ends = intervals
+    if not starts.size:
+        return np.zeros(values.shape, dtype=bool)
+    position = np.searchsorted(starts, values, side="right") - 1
+    return (position >= 0) & (values <= ends[np.maximum(position, 0)])
+
+
+def address_to_int(address: str) -> int:
+    address = ip_address(address.split("/")[0])
+    return int(address) + (IPV6_OFFSET if address.version == 6 else 0)
+
+
+class PolicySimulator:
+    """First-match evaluation of flows against the rendered rules of one firewall."""
+
+    def __init__(self, rules: List[Tuple[int, CompiledRule]], zones: Optional[PrefixTree] = None) -> None:
+        self.rules = [
+            SimulatedRule(
+                index=index,
+                rule=rule,
+                source=address_arrays(rule.source),
+                destination=address_arrays(rule.destination),
+                services=service_arrays(rule.services),
+            )
+            for index, rule in sorted(rules, key=lambda item: item[0])
+        ]
+        self.zones = zones or PrefixTree()
+        self.rules_by_zone_pair: Dict[Tuple[str, str], List[SimulatedRule]] = {}
+        for simulated in self.rules:
+            self.rules_by_zone_pair.setdefault((simulated.rule.source_zone, simulated.rule.destination_zone), []).append(simulated)
+        self.zone_names = {
+            zone: code for code, zone in enumerate(sorted({zone for pair in self.rules_by_zone_pair for zone in pair}))
+        }
+
+    @classmethod
+    async def from_device(cls, client: InfrahubClient, device: str) -> "PolicySimulator":
+        response = await client.execute_graphql(query=DEVICE_RULES_QUERY, variables={"device": device})
+        if not response["SecurityFirewall"]["edges"]:
+            raise ValueError(f"{device} is not a security firewall")
+        catalog = build_object_catalog(await client.execute_graphql(query=POLICY_OBJECTS_QUERY))
+        return cls.from_device_data(catalog, response["SecurityFirewall"]["edges"][0]["node"])
+
+    @classmethod
+    def from_device_data(cls, catalog: ObjectCatalog, device: dict) -> "PolicySimulator":
+        def peer_ids(node: dict, name: str) -> List[str]:
+            return [edge["node"]["id"] for edge in node[name]["edges"]]
+
+        rules = []
+        for edge in device["rules"]["edges"]:
+            node = edge["node"]
+            rule = CompiledRule(
+                id=node["id"],
+                name=node["name"]["value"],
+                action=node["action"]["value"],
+                source_zone=node["source_zone"]["node"]["name"]["value"],
+                destination_zone=node["destination_zone"]["node"]["name"]["value"],
+                source=catalog.expand_addresses(peer_ids(node, "source_address"), peer_ids(node, "source_groups")),
+                destination=catalog.expand_addresses(peer_ids(node, "destination_address"), peer_ids(node, "destination_groups")),
+                services=catalog.expand_services(peer_ids(node, "destination_services"), peer_ids(node, "destination_service_groups")),
+            )
+            rules.append((node["index"]["value"], rule))
+
+        zones = PrefixTree()
+        for edge in device["interfaces"]["edges"]:
+            interface = edge["node"]
+            if not (interface.get("security_zone") or {}).get("node"):
+                continue
+            for address in interface["ip_addresses"]["edges"]:
+                zones.add(ip_interface(address["node"]["address"]["value"]).network, interface["security_zone"]["node"]["name"]["value"])
+        return cls(rules=rules, zones=zones)
+
+    def find_zone(self, address: str) -> Optional[str]:
+        match = self.zones.longest_match(address.split("/")[0])
+        return match[1] if match else None
+
+    def find_zones(self, addresses: np.ndarray) -> np.ndarray:
+        unique, inverse = np.unique(addresses, return_inverse=True)
+        zones = np.array([self.find_zone(str(ip_address(int(address)))) for address in unique], dtype=object)
+        return zones[inverse]
+
+    def evaluate(
+        self,
+        source: np.ndarray,
+        destination: np.ndarray,
+        protocol: np.ndarray,
+        port: np.ndarray,
+        source_zone: Optional[np.ndarray] = None,
+        destination_zone: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Evaluates IPv4 flows given as integer arrays.
+
+        Returns the index of the first matching rule (-1 without match) and its action for each flow.
+        """
+        source = np.asarray(source, dtype=np.uint64)
+        destination = np.asarray(destination, dtype=np.uint64)
+        protocol = np.asarray(protocol, dtype=np.int64)
+        port = np.asarray(port, dtype=np.uint64)
+        source_codes = self.zone_codes(self.find_zones(source) if source_zone is None else source_zone)
+        destination_codes = self.zone_codes(self.find_zones(destination) if destination_zone is None else destination_zone)
+
+        # Only the rules of the flow's zone pair can match it, flows are grouped by zone pair first
+        pair_codes = np.where(
+            (source_codes >= 0) & (destination_codes >= 0), source_codes * len(self.zone_names) + destination_codes, -1
+        )
+        order = np.argsort(pair_codes, kind="stable")
+        sorted_codes = pair_codes[order]
+
+        indexes = np.full(source.shape, -1, dtype=np.int64)
+        actions = np.full(source.shape, NO_MATCH, dtype=object)
+        for (source_name, destination_name), rules in self.rules_by_zone_pair.items():
+            code = self.zone_names[source_name] * len(self.zone_names) + self.zone_names[destination_name]
+            low, high = np.searchsorted(sorted_codes, [code, code + 1])
+            pending = order[low:high]
+
+            for simulated in rules:
+                if not pending.size:
+                    break
+                mask = np.ones(pending.shape, dtype=bool)
+                if simulated.source is not None:
+                    mask &= in_intervals(source[pending], simulated.source)
+                if simulated.destination is not None:
+                    mask &= in_intervals(destination[pending], simulated.destination)
+                if simulated.services is not None:
+                    service_mask = np.zeros(pending.shape, dtype=bool)
+                    for service_protocol, ports in simulated.services.items():
+                        service_mask |= (protocol[pending] == service_protocol) & in_intervals(port[pending], ports)
+                    mask &= service_mask
+
+                matched = pending[mask]
+                indexes[matched] = simulated.index
+                actions[matched] = simulated.rule.action
+                pending = pending[~mask]
+
+        return indexes, actions
+
+    def zone_codes(self, zones: np.ndarray) -> np.ndarray:
+        unique, inverse = np.unique(np.asarray(zones, dtype=object).astype(str), return_inverse=True)
+        codes = np.array([self.zone_names.get(zone, -1) for zone in unique], dtype=np.int64)
+        return codes[inverse]
+
+    def evaluate_flow(
+        self,
+        source: str,
+        destination: str,
+        protocol: int,
+        port: int,
+        source_zone: Optional[str] = None,
+        destination_zone: Optional[str] = None,
+    ) -> Tuple[int, str]:
+        """Evaluates a single IPv4 or IPv6 flow."""
+        source_zone = source_zone or self.find_zone(source)
+        destination_zone = destination_zone or self.find_zone(destination)
+        source_value, destination_value = address_to_int(source), address_to_int(destination)
+
+        for simulated in self.rules:
+            rule = simulated.rule
+            if rule.source_zone != source_zone or rule.destination_zone != destination_zone:
+                continue
+            if not rule.source.any and not rule.source.addresses.contains(source_value):
+                continue
+            if not rule.destination.any and not rule.destination.addresses.contains(destination_value):
+                continue
+            if not rule.services.any and not any(
+                service_protocol == protocol and ports.contains(port) for service_protocol, ports in rule.services.ports
+            ):
+                continue
+            return simulated.index, rule.action
+        return -1, NO_MATCH
+
+
+def read_flows(path: Path) -> Tuple[List[Dict[str, str]], Dict[str, np.ndarray]]:
+    """Reads a CSV of flows (source,destination,protocol,port[,source_zone,destination_zone])."""
+    with open(path, newline="") as file:
+        rows = list(csv.DictReader(file))
+    ipv4 = [row for row in rows if ip_address(row["source"]).version == 4 and ip_address(row["destination"]).version == 4]
+    columns = {
+        "source": np.array([int(ip_address(row["source"])) for row in ipv4], dtype=np.uint64),
+        "destination": np.array([int(ip_address(row["destination"])) for row in ipv4], dtype=np.uint64),
+        "protocol": np.array([int(row["protocol"]) for row in ipv4], dtype=np.int64),
+        "port": np.array([int(row["port"]) for row in ipv4], dtype=np.uint64),
+    }
+    if ipv4 and all(row.get("source_zone") and row.get("destination_zone") for row in ipv4):
+        columns["source_zone"] = np.array([row["source_zone"] for row in ipv4], dtype=object)
+        columns["destination_zone"] = np.array([row["destination_zone"] for row in ipv4], dtype=object)
+    return rows, columns
+
+
+def write_results(path: Path, rows: Sequence[Dict[str, str]], results: List[Tuple[int, str]]) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["source", "destination", "protocol", "port", "rule_index", "action"])
+        for row, (index, action) in zip(rows, results):
+            writer.writerow([row["source"], row["destination"], row["protocol"], row["port"], index, action])
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run generators/policy_simulator.py device=<firewall> flows=flows.csv
+#
+#   Optional: output=results.csv
+#
+# ---------------------------------------------------------------
+async def run(client: InfrahubClient, log: logging.Logger, branch: str, **kwargs) -> None:
+    if "device" not in kwargs or "flows" not in kwargs:
+        log.error("Missing argument, use device=<firewall> flows=<path>")
+        exit(1)
+
+    simulator = await PolicySimulator.from_device(client, kwargs["device"])
+    log.info(f"Compiled {len(simulator.rules)} rules of {kwargs['device']}")
+
+    rows, columns = read_flows(Path(kwargs["flows"]))
+    indexes, actions = simulator.evaluate(**columns)
+    ipv4_results = iter(zip(indexes.tolist(), actions.tolist()))
+
+    results = []
+    for row in rows:
+        if ip_address(row["source"]).version == 4 and ip_address(row["destination"]).version == 4:
+            results.append(next(ipv4_results))
+        else:
+            results.append(
+                simulator.evaluate_flow(
+                    row["source"],
+                    row["destination"],
+                    int(row["protocol"]),
+                    int(row["port"]),
+                    row.get("source_zone") or None,
+                    row.get("destination_zone") or None,
+                )
+            )
+
+    for action, count in sorted(Counter(action for _, action in results).items()):
+        log.info(f"- {action}: {count} flows")
+    if "output" in kwargs:
+        write_results(Path(kwargs["output"]), rows, results)
+        log.info(f"Results written to {kwargs['output']}")
@@ -1,132 +1,500 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
+import time
 
-from typing import List, Set
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
 from infrahub_sdk import InfrahubClient
+from infrahub_sdk.exceptions import GraphQLError
 from infrahub_sdk.node import InfrahubNode
 
-async def get_devices_from_location_hierarchy(location: InfrahubNode) -> List[InfrahubNode]:
-    devices = []
+from policy_compiler import (
+    POLICY_OBJECTS_QUERY,
+    CompiledRule,
+    EliminatedRule,
+    ObjectCatalog,
+    RuleConflict,
+    build_object_catalog,
+    eliminate_covered_rules,
+)
 
-    await location.devices.fetch()
 
-    if len(location.devices.peers):
-        devices.extend([rel_node.peer for rel_node in location.devices.peers])
+FIREWALL_KIND = "SecurityFirewall"
 
-    if hasattr(location, "children"):
-        await location.children.fetch()
-        if len(location.children.peers):
-            for child in location.children.peers:
-                devices.extend(await get_devices_from_location_hierarchy(child.peer))
-    return devices
+DEFAULT_WORKERS = 1
 
-async def get_policies_from_location_hierarchy(location: InfrahubNode) -> List[InfrahubNode]:
-    policies = []
+RENDERED_RULE_RELATIONSHIPS = (
+    "source_address",
+    "source_groups",
+    "source_services",
+    "source_service_groups",
+    "destination_address",
+    "destination_groups",
+    "destination_services",
+    "destination_service_groups",
+)
 
-    if location.policy.id:
-        await location.policy.fetch()
-        policies.append(location.policy.peer)
+LOCATION_DEVICES_QUERY = """
+query LocationDescendantDevices($location_ids: [ID]) {
+  LocationGeneric(ids: $location_ids) {
+    edges {
+      node {
+        id
+        devices { edges { node { id __typename } } }
+        descendants {
+          edges {
+            node {
+              id
+              devices { edges { node { id __typename } } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
 
-    if hasattr(location, "parent") and location.parent.id:
-        await location.parent.fetch()
-        policies.extend(await get_policies_from_location_hierarchy(location.parent.peer))
+LOCATION_LEVEL_QUERY = """
+query LocationLevelDevices($location_ids: [ID]) {
+  LocationGeneric(%s: $location_ids) {
+    edges {
+      node {
+        id
+        devices { edges { node { id __typename } } }
+      }
+    }
+  }
+}
+"""
 
-    return policies
+LOCATION_POLICY_CHAIN_QUERY = """
+query LocationPolicyChain($location_ids: [ID]) {
+  LocationGeneric(ids: $location_ids) {
+    edges {
+      node {
+        id
+        parent { node { id } }
+        policy { node { id } }
+        ancestors {
+          edges {
+            node {
+              id
+              parent { node { id } }
+              policy { node { id } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class CompiledPolicy:
+    policy: InfrahubNode
+    # (source zone id, destination zone id) -> rules of the zone pair with their position in the policy
+    rules_by_zone_pair: Dict[Tuple[str, str], List[Tuple[int, InfrahubNode]]] = field(default_factory=dict)
+
+    def select(self, zone_ids: Set[str]) -> List[InfrahubNode]:
+        if len(self.rules_by_zone_pair) < len(zone_ids) ** 2:
+            pairs = [pair for pair in self.rules_by_zone_pair if pair[0] in zone_ids and pair[1] in zone_ids]
+        else:
+            pairs = [pair for pair in product(zone_ids, repeat=2) if pair in self.rules_by_zone_pair]
+        matches = [match for pair in pairs for match in self.rules_by_zone_pair[pair]]
+        return [rule for _, rule in sorted(matches, key=lambda match: match[0])]
+
+
+@dataclass
+class RenderedRuleDiff:
+    # (index, policy rule, existing rendered rule) of every rule to write
+    inserted: List[Tuple[int, InfrahubNode, Optional[InfrahubNode]]] = field(default_factory=list)
+    updated: List[Tuple[int, InfrahubNode, InfrahubNode]] = field(default_factory=list)
+    reindexed: List[Tuple[int, InfrahubNode, InfrahubNode]] = field(default_factory=list)
+    removed: List[InfrahubNode] = field(default_factory=list)
+    unchanged: int = 0
+    # Rules left out by the compile pass, and rules it kept although an earlier rule with another action covers them
+    eliminated: List[EliminatedRule] = field(default_factory=list)
+    conflicts: List[RuleConflict] = field(default_factory=list)
+
+
+class PolicyRenderCache:
+    """Objects resolved once and shared by every device rendered in the same run."""
+
+    def __init__(self, client: InfrahubClient, compile_rules: bool = False) -> None:
+        self.client = client
+        self.compile_rules = compile_rules
+        self.catalog: Optional[asyncio.Future] = None
+        # location id -> firewalls located in the location or any of its descendants
+        self.location_devices: Dict[str, List[InfrahubNode]] = {}
+        self.devices: Dict[str, InfrahubNode] = {}
+        # location id -> policies of the location and its ancestors, ordered from the root to the location
+        self.location_policies: Dict[str, List[InfrahubNode]] = {}
+        # policy id -> policies fetched with it, by id
+        self.policies: Dict[str, asyncio.Future] = {}
+        # policy id -> compiled rules of the policy, fetched once with their relationships
+        self.compiled_policies: Dict[str, asyncio.Future] = {}
+        self.account: Optional[asyncio.Future] = None
+        # device id -> ids of the security zones of its interfaces
+        self.device_zones: Dict[str, Set[str]] = {}
+
+    async def get_devices(self, device_ids: List[str]) -> List[InfrahubNode]:
+        missing = [device_id for device_id in device_ids if device_id not in self.devices]
+        if missing:
+            for device in await self.client.filters(kind=FIREWALL_KIND, ids=missing, include=["rules"]):
+                self.devices[device.id] = device
+        return [self.devices[device_id] for device_id in device_ids if device_id in self.devices]
+
+    async def get_policies(self, policy_ids: List[str]) -> List[InfrahubNode]:
+        missing = [policy_id for policy_id in dict.fromkeys(policy_ids) if policy_id not in self.policies]
+        if missing:
+            # Devices rendered concurrently wait on the same task instead of fetching the policies again
+            task = asyncio.ensure_future(fetch_policies(self.client, missing))
+            for policy_id in missing:
+                self.policies[policy_id] = task
+        policies = []
+        for policy_id in policy_ids:
+            policy = (await self.policies[policy_id]).get(policy_id)
+            if not policy:
+                raise ValueError(f"policy {policy_id} doesn't exist")
+            policies.append(policy)
+        return policies
+
+    async def get_compiled_policy(self, policy: InfrahubNode) -> CompiledPolicy:
+        # Devices rendered concurrently wait on the same task instead of fetching the policy again
+        if policy.id not in self.compiled_policies:
+            self.compiled_policies[policy.id] = asyncio.ensure_future(compile_policy(self.client, policy))
+        return await self.compiled_policies[policy.id]
+
+    async def get_security_zones(self, device_ids: List[str]) -> Dict[str, Set[str]]:
+        missing = [device_id for device_id in device_ids if device_id not in self.device_zones]
+        if missing:
+            self.device_zones.update(await get_devices_security_zones(self.client, missing))
+        return {device_id: self.device_zones[device_id] for device_id in device_ids}
+
+    async def get_catalog(self) -> ObjectCatalog:
+        if not self.catalog:
+            self.catalog = asyncio.ensure_future(load_object_catalog(self.client))
+        return await self.catalog
+
+    async def get_account(self) -> InfrahubNode:
+        if not self.account:
+            self.account = asyncio.ensure_future(self.client.get("CoreAccount", name__value="generator"))
+        return await self.account
+
+
+def extract_firewall_ids(location: dict) -> List[str]:
+    return [
+        edge["node"]["id"] for edge in location["devices"]["edges"] if edge["node"]["__typename"] == FIREWALL_KIND
+    ]
+
+async def query_descendant_firewall_ids(client: InfrahubClient, location_id: str) -> List[str]:
+    response = await client.execute_graphql(query=LOCATION_DEVICES_QUERY, variables={"location_ids": [location_id]})
+    device_ids = []
+    for edge in response["LocationGeneric"]["edges"]:
+        location = edge["node"]
+        device_ids.extend(extract_firewall_ids(location))
+        for descendant in location["descendants"]["edges"]:
+            device_ids.extend(extract_firewall_ids(descendant["node"]))
+    return device_ids
+
+async def walk_descendant_firewall_ids(client: InfrahubClient, location_id: str) -> List[str]:
+    # Breadth-first walk, one query per level of the hierarchy
+    device_ids = []
+    level = [location_id]
+    location_filter = "ids"
+    while level:
+        response = await client.execute_graphql(query=LOCATION_LEVEL_QUERY % location_filter, variables={"location_ids": level})
+        level = []
+        for edge in response["LocationGeneric"]["edges"]:
+            device_ids.extend(extract_firewall_ids(edge["node"]))
+            level.append(edge["node"]["id"])
+        location_filter = "parent__ids"
+    return device_ids
+
+async def get_devices_from_location_hierarchy(cache: PolicyRenderCache, location_id: str) -> List[InfrahubNode]:
+    if location_id not in cache.location_devices:
+        try:
+            device_ids = await query_descendant_firewall_ids(cache.client, location_id)
+        except GraphQLError:
+            device_ids = await walk_descendant_firewall_ids(cache.client, location_id)
+        cache.location_devices[location_id] = await cache.get_devices(list(dict.fromkeys(device_ids)))
+    return cache.location_devices[location_id]
+
+def extract_related_id(location: dict, name: str) -> Optional[str]:
+    related = location.get(name)
+    if related and related.get("node"):
+        return related["node"]["id"]
+    return None
 
-async def find_policy_targets(policy: InfrahubNode) -> List[InfrahubNode]:
+async def get_policies_from_location_hierarchy(cache: PolicyRenderCache, location_id: str) -> List[InfrahubNode]:
+    if location_id in cache.location_policies:
+        return cache.location_policies[location_id]
+
+    response = await cache.client.execute_graphql(query=LOCATION_POLICY_CHAIN_QUERY, variables={"location_ids": [location_id]})
+    locations = {}
+    for edge in response["LocationGeneric"]["edges"]:
+        locations[edge["node"]["id"]] = edge["node"]
+        for ancestor in edge["node"]["ancestors"]["edges"]:
+            locations[ancestor["node"]["id"]] = ancestor["node"]
+
+    # Walk up through the parent ids, the chain of each ancestor is a suffix of this one
+    chain = []
+    current_id = location_id
+    while current_id in locations:
+        chain.append(current_id)
+        current_id = extract_related_id(locations[current_id], "parent")
+
+    policy_ids = [extract_related_id(locations[chain_id], "policy") for chain_id in reversed(chain)]
+    policies = await cache.get_policies([policy_id for policy_id in policy_ids if policy_id])
+
+    for position, chain_id in enumerate(reversed(chain)):
+        # Policies of the location chain up to and including this location
+        count = len([policy_id for policy_id in policy_ids[: position + 1] if policy_id])
+        cache.location_policies.setdefault(chain_id, policies[:count])
+    return cache.location_policies[location_id]
+
+async def find_policy_targets(cache: PolicyRenderCache, policy: InfrahubNode) -> List[InfrahubNode]:
     targets = []
 
     if policy.device_target.initialized:
-        await policy.device_target.fetch()
-        targets.append(policy.device_target.peer)
+        targets.extend(await cache.get_devices([policy.device_target.id]))
 
     if policy.location_target.initialized:
-        await policy.location_target.fetch()
-        targets.extend(await get_devices_from_location_hierarchy(policy.location_target.peer))
+        for device in await get_devices_from_location_hierarchy(cache, policy.location_target.id):
+            if device not in targets:
+                targets.append(device)
 
     return targets
 
-async def get_device_security_zones(device: InfrahubNode) -> Set[InfrahubNode]:
-    await device.interfaces.fetch()
-    zones = set()
-
-    for interface in device.interfaces.peers:
-        if hasattr(interface.peer, "security_zone"):
-            await interface.peer.security_zone.fetch()
-            if interface.peer.security_zone:
-                zones.add(interface.peer.security_zone.peer)
+async def get_devices_security_zones(client: InfrahubClient, device_ids: List[str]) -> Dict[str, Set[str]]:
+    zones: Dict[str, Set[str]] = {device_id: set() for device_id in device_ids}
+    interfaces = await client.filters("SecurityFirewallInterface", device__ids=device_ids)
+    for interface in interfaces:
+        if interface.security_zone.id and interface.device.id in zones:
+            zones[interface.device.id].add(interface.security_zone.id)
     return zones
 
-async def find_device_policies(device: InfrahubNode) -> List[InfrahubNode]:
-    await device.location.fetch()
+async def find_device_policies(cache: PolicyRenderCache, device: InfrahubNode) -> List[InfrahubNode]:
+    policies = list(await get_policies_from_location_hierarchy(cache, device.location.id))
+    if device.policy.initialized and device.policy.id:
+        policies.extend(await cache.get_policies([device.policy.id]))
+    return policies
+
+async def fetch_policies(client: InfrahubClient, policy_ids: List[str]) -> Dict[str, InfrahubNode]:
+    return {policy.id: policy for policy in await client.filters(kind="SecurityPolicy", ids=policy_ids)}
+
+async def compile_policy(client: InfrahubClient, policy: InfrahubNode) -> CompiledPolicy:
+    compiled = CompiledPolicy(policy=policy)
+    rules = await client.filters("SecurityPolicyRule", policy__ids=[policy.id], populate_store=True, prefetch_relationships=True)
+    for position, rule in enumerate(rules):
+        if rule.source_zone.id and rule.destination_zone.id:
+            compiled.rules_by_zone_pair.setdefault((rule.source_zone.id, rule.destination_zone.id), []).append((position, rule))
+    return compiled
+
+async def load_object_catalog(client: InfrahubClient) -> ObjectCatalog:
+    return build_object_catalog(await client.execute_graphql(query=POLICY_OBJECTS_QUERY))
+
+def to_compiled_rule(catalog: ObjectCatalog, rule: InfrahubNode) -> CompiledRule:
+    return CompiledRule(
+        id=rule.id,
+        name=rule.name.value,
+        action=rule.action.value,
+        source_zone=rule.source_zone.id,
+        destination_zone=rule.destination_zone.id,
+        source=catalog.expand_addresses(rule.source_address.peer_ids, rule.source_groups.peer_ids),
+        destination=catalog.expand_addresses(rule.destination_address.peer_ids, rule.destination_groups.peer_ids),
+        # Only the destination services are part of the rendered configuration
+        services=catalog.expand_services(rule.destination_services.peer_ids, rule.destination_service_groups.peer_ids),
+    )
 
-    if device.policy.initialized:
-        await device.policy.fetch()
-    policies = await get_policies_from_location_hierarchy(device.location.peer)
-    if device.policy.initialized and device.policy.peer:
-        policies.insert(0, device.policy.peer)
-    return policies[::-1]
+def get_rule_signature(rule: InfrahubNode, policy_relationship: str) -> tuple:
+    return (
+        rule.name.value,
+        rule.action.value,
+        bool(rule.log.value),
+        getattr(rule, policy_relationship).id,
+        rule.source_zone.id,
+        rule.destination_zone.id,
+        *(frozenset(peer.id for peer in getattr(rule, name).peers) for name in RENDERED_RULE_RELATIONSHIPS),
+    )
 
-async def render_policy_for_device(client: InfrahubClient, device: InfrahubNode, policies: List[InfrahubNode]) -> None:
-    index = 0
-    rendered_rules=[]
+def get_rendered_rule_data(account: InfrahubNode, index: int, rule: InfrahubNode) -> dict:
+    return {
+        "index": {"value": index, "is_protected": True, "owner": account.id},
+        "action": {"value": rule.action.value, "is_protected": True, "owner": account.id},
+        "log": {"value": rule.log.value, "is_protected": True, "owner": account.id},
+        "name": {"value": rule.name.value, "is_protected": True, "owner": account.id},
+        "source_rule": {"id": rule.id, "is_protected": True, "owner": account.id},
+        "source_zone": {"id": rule.source_zone.id, "is_protected": True, "owner": account.id},
+        "destination_zone": {"id": rule.destination_zone.id, "is_protected": True, "owner": account.id},
+        "source_policy": {"id": rule.policy.id, "is_protected": True, "owner": account.id},
+        **{
+            name: [{"id": peer.id, "is_protected": True, "owner": account.id} for peer in getattr(rule, name).peers]
+            for name in RENDERED_RULE_RELATIONSHIPS
+        },
+    }
 
-    account = await client.get("CoreAccount", name__value="generator")
-    await device.rules.fetch()
-    rules = [rule.peer for rule in device.rules.peers]
+def diff_rendered_rules(rules: List[InfrahubNode], rendered_rules: List[InfrahubNode]) -> RenderedRuleDiff:
+    diff = RenderedRuleDiff()
+    existing: Dict[str, InfrahubNode] = {}
+    for rendered_rule in rendered_rules:
+        # Rules rendered before source_rule existed, or rendered twice, can't be matched
+        if not rendered_rule.source_rule.id or rendered_rule.source_rule.id in existing:
+            diff.removed.append(rendered_rule)
+        else:
+            existing[rendered_rule.source_rule.id] = rendered_rule
 
-    for rule in rules:
-        device.rules.remove(rule)
-    await device.save()
+    for index, rule in enumerate(rules):
+        rendered_rule = existing.pop(rule.id, None)
+        if not rendered_rule:
+            diff.inserted.append((index, rule, None))
+        elif get_rule_signature(rendered_rule, "source_policy") != get_rule_signature(rule, "policy"):
+            diff.updated.append((index, rule, rendered_rule))
+        elif rendered_rule.index.value != index:
+            diff.reindexed.append((index, rule, rendered_rule))
+        else:
+            diff.unchanged += 1
 
-    for rule in rules:
-        await client.delete(kind="SecurityRenderedPolicyRule", id=rule.id)
+    diff.removed.extend(existing.values())
+    return diff
 
-    security_zones = await get_device_security_zones(device)
+async def render_policy_for_device(client: InfrahubClient, cache: PolicyRenderCache, device: InfrahubNode, policies: List[InfrahubNode]) -> RenderedRuleDiff:
+    account = await cache.get_account()
+    security_zones = (await cache.get_security_zones([device.id]))[device.id]
 
-    # async with client.start_tracking(identifier=Path(__file__).stem, params={"device": device.name.value}, delete_unused_nodes=True) as client:
+    rules = []
     for policy in policies:
-        rules = await client.filters("SecurityPolicyRule", policy__ids=[policy.id], populate_store=True, prefetch_relationships=True)
-
-        for rule in rules:
-            if rule.source_zone.peer in security_zones and rule.destination_zone.peer in security_zones:
-                rendered_rule = await client.create(
-                    "SecurityRenderedPolicyRule",
-                    index={"value": index, "is_protected": True, "owner": account.id},
-                    action={"value": rule.action.value, "is_protected": True, "owner": account.id},
-                    log={"value": rule.log.value, "is_protected": True, "owner": account.id},
-                    name={"value": rule.name.value, "is_protected": True, "owner": account.id},
-                    source_zone = {"id": rule.source_zone.peer.id,  "is_protected": True, "owner": account.id},
-                    destination_zone = {"id": rule.destination_zone.peer.id, "is_protected": True, "owner": account.id},
-                    source_policy={"id": rule.policy.peer.id, "is_protected": True, "owner": account.id},
-                    source_address=[{"id": s.peer.id, "is_protected": True, "owner": account.id} for s in rule.source_address.peers],
-                    source_groups=[{"id": s.peer.id, "is_protected": True, "owner": account.id}  for s in rule.source_groups.peers],
-                    source_services=[{"id": s.peer.id, "is_protected": True, "owner": account.id} for s in rule.source_services.peers],
-                    source_service_groups=[{"id": s.peer.id, "is_protected": True, "owner": account.id} for s in rule.source_service_groups.peers],
-                    destination_address=[{"id": d.peer.id, "is_protected": True, "owner": account.id} for d in rule.destination_address.peers],
-                    destination_groups=[{"id": d.peer.id, "is_protected": True, "owner": account.id} for d in rule.destination_groups.peers],
-                    destination_services=[{"id": d.peer.id, "is_protected": True, "owner": account.id} for d in rule.destination_services.peers],
-                    destination_service_groups=[{"id": d.peer.id, "is_protected": True, "owner": account.id} for d in rule.destination_service_groups.peers],
-                )
-                await rendered_rule.save(allow_upsert=True)
-                rendered_rules.append(rendered_rule)
-                index += 1
-
-    await device.rules.fetch()
-    device.rules.extend({"id": rule.id, "is_protected": True, "owner": account.id} for rule in rendered_rules)
-    await device.save()
+        compiled = await cache.get_compiled_policy(policy)
+        rules.extend(compiled.select(security_zones))
 
+    eliminated, conflicts = [], []
+    if cache.compile_rules:
+        catalog = await cache.get_catalog()
+        kept, eliminated, conflicts = eliminate_covered_rules([to_compiled_rule(catalog, rule) for rule in rules])
+        kept_ids = {rule.id for rule in kept}
+        rules = [rule for rule in rules if rule.id in kept_ids]
+
+    rendered_rules = []
+    if device.rules.peer_ids:
+        rendered_rules = await client.filters("SecurityRenderedPolicyRule", ids=device.rules.peer_ids)
+    diff = diff_rendered_rules(rules, rendered_rules)
+    diff.eliminated = eliminated
+    diff.conflicts = conflicts
+
+    # ------------------------------------------
+    # Write inserted, updated and reindexed rules
+    # ------------------------------------------
+    created_rules = []
+    batch = await client.create_batch()
+    for index, rule, rendered_rule in diff.inserted + diff.updated + diff.reindexed:
+        data = get_rendered_rule_data(account, index, rule)
+        if rendered_rule:
+            data["id"] = rendered_rule.id
+        obj = await client.create("SecurityRenderedPolicyRule", data=data)
+        batch.add(task=obj.save, allow_upsert=True, node=obj)
+        if not rendered_rule:
+            created_rules.append(obj)
+    async for _, _ in batch.execute():
+        pass
+
+    if created_rules or diff.removed:
+        for rendered_rule in diff.removed:
+            device.rules.remove(rendered_rule.id)
+        device.rules.extend({"id": rule.id, "is_protected": True, "owner": account.id} for rule in created_rules)
+        await device.save()
+
+    # ------------------------------------------
+    # Delete the rules no longer rendered
+    # ------------------------------------------
+    if diff.removed:
+        batch = await client.create_batch()
+        for rendered_rule in diff.removed:
+            batch.add(task=rendered_rule.delete, node=rendered_rule)
+        async for _, _ in batch.execute():
+            pass
+
+    return diff
+
+@dataclass
+class DeviceRenderResult:
+    device: InfrahubNode
+    duration: float
+    diff: Optional[RenderedRuleDiff] = None
+    error: Optional[Exception] = None
+
+    @property
+    def rules(self) -> int:
+        if not self.diff:
+            return 0
+        return len(self.diff.inserted) + len(self.diff.updated) + len(self.diff.reindexed) + self.diff.unchanged
+
+async def render_device(
+    client: InfrahubClient, log: logging.Logger, cache: PolicyRenderCache, device: InfrahubNode, semaphore: asyncio.Semaphore
+) -> DeviceRenderResult:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            policies = await find_device_policies(cache, device)
+            diff = await render_policy_for_device(client, cache, device, policies)
+        except Exception as exc:
+            log.error(f"- Failed to render {device.name.value}: {exc}")
+            return DeviceRenderResult(device=device, duration=time.perf_counter() - start, error=exc)
+        for eliminated in diff.eliminated:
+            log.info(
+                f"- {device.name.value}: left out redundant rule {eliminated.rule.name}, "
+                f"covered by {eliminated.covered_by.name}"
+            )
+        for conflict in diff.conflicts:
+            log.warning(
+                f"- {device.name.value}: {conflict.rule.action} rule {conflict.rule.name} never matches, "
+                f"covered by {conflict.covered_by.action} rule {conflict.covered_by.name}"
+            )
+        return DeviceRenderResult(device=device, duration=time.perf_counter() - start, diff=diff)
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run generators/render_security_policy.py policy=<name>
+#
+#   Optional: workers=1, number of devices rendered at the same time
+#             compile=false, leave out the rules fully covered by an earlier rule with the same action
+#
+# ---------------------------------------------------------------
 async def run(client: InfrahubClient, log: logging.Logger, branch: str, **kwargs) -> None:
     if not "policy" in kwargs:
         raise ValueError("no policy argument provided")
 
     policy_name = kwargs["policy"]
+    workers = int(kwargs.get("workers", DEFAULT_WORKERS))
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
 
+    start = time.perf_counter()
     policy = await client.get(kind="SecurityPolicy", name__value=policy_name)
-    targets = await find_policy_targets(policy)
+    cache = PolicyRenderCache(client, compile_rules=str(kwargs.get("compile", "false")).lower() == "true")
+    targets = await find_policy_targets(cache, policy)
+    log.info(f"Rendering {policy_name} on {len(targets)} devices with {workers} workers")
+    await cache.get_security_zones([target.id for target in targets])
+
+    semaphore = asyncio.Semaphore(workers)
+    results = await asyncio.gather(*(render_device(client, log, cache, target, semaphore) for target in targets))
 
-    for target in targets:
-        policies = await find_device_policies(target)
-        await render_policy_for_device(client, target, policies)
+    failed = [result for result in results if result.error]
+    for result in results:
+        if result.diff:
+            log.info(
+                f"- {result.device.name.value}: {result.rules} rules "
+                f"({len(result.diff.inserted)} inserted, {len(result.diff.updated)} updated, "
+                f"{len(result.diff.reindexed)} reindexed, {len(result.diff.removed)} removed) in {result.duration:.2f}s"
+            )
+    log.info(f"Rendered {len(results) - len(failed)}/{len(results)} devices in {time.perf_counter() - start:.2f}s")
+    if failed:
+        log.error(f"Failed devices: {', '.join(result.device.name.value for result in failed)}")
+        exit(1)
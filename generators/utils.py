@@ -1,6 +1,7 @@
 import logging
 
-from typing import Dict, List, Optional
+from ipaddress import IPv4Network, IPv6Network, ip_network
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.batch import InfrahubBatch
@@ -60,3 +61,132 @@ def populate_local_store(objects: List[InfrahubNode], key_type: str, store: Node
         key = getattr(obj, key_type)
         if key:
             store.set(key=key.value, node=obj)
+
+def get_subnet_by_index(network: Union[IPv4Network, IPv6Network], new_prefix: int, index: int) -> Union[IPv4Network, IPv6Network]:
+    """Returns the subnet at `index` (negative counts from the end) without enumerating the others."""
+    subnets_count = 1 << (new_prefix - network.prefixlen)
+    if index < 0:
+        index += subnets_count
+    if not 0 <= index < subnets_count:
+        raise IndexError(f"{network} has no /{new_prefix} at index {index}")
+    subnet_size = 1 << (network.max_prefixlen - new_prefix)
+    return ip_network((int(network.network_address) + index * subnet_size, new_prefix))
+
+
+class _PrefixTreeNode:
+    __slots__ = ("children", "value", "stored")
+
+    def __init__(self) -> None:
+        self.children: List[Optional["_PrefixTreeNode"]] = [None, None]
+        self.value: Any = None
+        self.stored = False
+
+
+class PrefixTree:
+    """Binary radix tree of IPv4/IPv6 prefixes, lookups cost O(prefix length)."""
+
+    def __init__(self) -> None:
+        self._roots = {4: _PrefixTreeNode(), 6: _PrefixTreeNode()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, prefix: Union[str, IPv4Network, IPv6Network]) -> bool:
+        node = self._find(ip_network(prefix))
+        return node is not None and node.stored
+
+    @classmethod
+    def from_prefix_nodes(cls, prefixes: List[InfrahubNode]) -> "PrefixTree":
+        """Builds a tree from InfraPrefix nodes, the node is kept as the value of its prefix."""
+        tree = cls()
+        for prefix in prefixes:
+            tree.add(prefix.prefix.value, prefix)
+        return tree
+
+    @staticmethod
+    def _bits(network: Union[IPv4Network, IPv6Network]) -> Iterator[int]:
+        address = int(network.network_address)
+        for position in range(network.max_prefixlen - 1, network.max_prefixlen - 1 - network.prefixlen, -1):
+            yield (address >> position) & 1
+
+    def _find(self, network: Union[IPv4Network, IPv6Network]) -> Optional[_PrefixTreeNode]:
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            node = node.children[bit]
+            if node is None:
+                return None
+        return node
+
+    def add(self, prefix: Union[str, IPv4Network, IPv6Network], value: Any = None) -> None:
+        network = ip_network(prefix)
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            if node.children[bit] is None:
+                node.children[bit] = _PrefixTreeNode()
+            node = node.children[bit]
+        if not node.stored:
+            self._size += 1
+        node.stored = True
+        node.value = value
+
+    def get(self, prefix: Union[str, IPv4Network, IPv6Network], default: Any = None) -> Any:
+        node = self._find(ip_network(prefix))
+        return node.value if node is not None and node.stored else default
+
+    def longest_match(
+        self, prefix: Union[str, IPv4Network, IPv6Network], strict: bool = False
+    ) -> Optional[Tuple[Union[IPv4Network, IPv6Network], Any]]:
+        """Returns the most specific stored prefix containing `prefix` (an address is a /32 or /128).
+
+        With `strict`, `prefix` itself is skipped, which gives its parent.
+        """
+        network = ip_network(prefix, strict=False)
+        node = self._roots[network.version]
+        match = (0, node.value) if node.stored else None
+        for depth, bit in enumerate(self._bits(network), start=1):
+            if strict and depth == network.prefixlen:
+                break
+            node = node.children[bit]
+            if node is None:
+                break
+            if node.stored:
+                match = (depth, node.value)
+        if match is None:
+            return None
+        return network.supernet(new_prefix=match[0]), match[1]
+
+    def parent(self, prefix: Union[str, IPv4Network, IPv6Network]) -> Optional[Tuple[Union[IPv4Network, IPv6Network], Any]]:
+        return self.longest_match(prefix, strict=True)
+
+    def covers(self, prefix: Union[str, IPv4Network, IPv6Network]) -> bool:
+        """Returns True when `prefix` is equal to or inside a stored prefix."""
+        return self.longest_match(prefix) is not None
+
+    def free_subnets(
+        self, prefix: Union[str, IPv4Network, IPv6Network], new_prefix: Optional[int] = None
+    ) -> Iterator[Union[IPv4Network, IPv6Network]]:
+        """Yields the parts of `prefix` not overlapping any stored prefix below it, in address order.
+
+        Without `new_prefix` the largest free blocks are returned, otherwise they are cut into `new_prefix` subnets.
+        """
+        network = ip_network(prefix)
+        node = self._find(network)
+        stack = [(network, node)]
+        while stack:
+            current, current_node = stack.pop()
+            if current_node is None:
+                if new_prefix is None or current.prefixlen >= new_prefix:
+                    yield current
+                else:
+                    yield from current.subnets(new_prefix=new_prefix)
+                continue
+            if current_node.stored and current != network:
+                continue
+            if current.prefixlen == current.max_prefixlen:
+                continue
+            if new_prefix is not None and current.prefixlen >= new_prefix:
+                continue
+            low, high = current.subnets()
+            stack.append((high, current_node.children[1]))
+            stack.append((low, current_node.children[0]))
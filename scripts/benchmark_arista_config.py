@@ -0,0 +1,80 @@
+"""Benchmark of the Arista startup config, Jinja2 template against the Python transform.
+
+The baseline test input is scaled up to the requested number of interfaces and network services,
+both renders must be identical.
+
+    python scripts/benchmark_arista_config.py --interfaces 500 --services 500 --iterations 20
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+
+from pathlib import Path
+
+import jinja2
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "transforms"))
+
+from arista_config import render_config  # noqa: E402
+
+TEMPLATE = "templates/device_arista_config.tpl.j2"
+BASELINE = ROOT / "tests" / "device_arista" / "baseline" / "input.json"
+
+
+def scale(data: dict, interfaces: int, services: int) -> dict:
+    data = copy.deepcopy(data)
+    device = data["data"]["InfraDevice"]["edges"][0]["node"]
+    interface_edges = device["interfaces"]["edges"]
+    service_edges = device["topology"]["node"]["network_services"]["edges"]
+
+    templates = list(interface_edges)
+    for position in range(len(interface_edges), interfaces):
+        edge = copy.deepcopy(templates[position % len(templates)])
+        edge["node"]["name"]["value"] = f"Ethernet{position + 100}"
+        interface_edges.append(edge)
+
+    templates = list(service_edges)
+    for position in range(len(service_edges), services):
+        edge = copy.deepcopy(templates[position % len(templates)])
+        edge["node"]["vlan"]["node"]["vlan_id"]["value"] = 2000 + position
+        service_edges.append(edge)
+    return data
+
+
+def measure(render, data: dict, iterations: int) -> tuple:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        output = render(data)
+    return output, (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interfaces", type=int, default=500)
+    parser.add_argument("--services", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(ROOT), trim_blocks=True, lstrip_blocks=True)
+    template = environment.get_template(TEMPLATE)
+    baseline = json.loads(BASELINE.read_text())
+
+    for name, data in (
+        ("baseline", baseline),
+        (f"{args.interfaces} interfaces x {args.services} services", scale(baseline, args.interfaces, args.services)),
+    ):
+        expected, jinja_duration = measure(lambda data: template.render(**data), data, args.iterations)
+        rendered, python_duration = measure(lambda data: render_config(data["data"]), data, args.iterations)
+        if rendered != expected:
+            raise SystemExit(f"{name}: the Python transform doesn't match the template")
+        print(
+            f"{name}: jinja2 {jinja_duration * 1000:.2f}ms, python {python_duration * 1000:.2f}ms "
+            f"({jinja_duration / python_duration:.1f}x), outputs identical"
+        )
+
+
+if __name__ == "__main__":
+    main()
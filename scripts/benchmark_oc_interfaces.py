@@ -0,0 +1,88 @@
+"""Benchmark of the OCInterfaces transform on synthetic high port-count devices.
+
+The transform is first checked against tests/oc_interfaces/baseline, then timed on a device with
+the requested number of interfaces and addresses per interface, building the payload and
+streaming it as JSON.
+
+    python scripts/benchmark_oc_interfaces.py --interfaces 10000 --addresses 4
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "transforms"))
+
+from openconfig import OCInterfaces, iter_json  # noqa: E402
+
+BASELINE = ROOT / "tests" / "oc_interfaces" / "baseline"
+
+
+def build_input(interfaces: int, addresses: int) -> dict:
+    edges = []
+    for position in range(interfaces):
+        ip_edges = [
+            {"node": {"address": {"value": f"10.{position >> 8 & 255}.{position & 255}.{index * 2}/31"}}}
+            for index in range(addresses if position % 4 else 0)
+        ]
+        edges.append(
+            {
+                "node": {
+                    "name": {"value": f"Ethernet{position // 48 + 1}/{position % 48 + 1}"},
+                    "description": {"value": f"port {position}" if position % 3 else None},
+                    "enabled": {"value": bool(position % 5)},
+                    "ip_addresses": {"edges": ip_edges},
+                }
+            }
+        )
+    return {"InfraDevice": {"edges": [{"node": {"id": "benchmark", "interfaces": {"edges": edges}}}]}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interfaces", type=int, default=10000)
+    parser.add_argument("--addresses", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    transform = OCInterfaces()
+    baseline_input = json.loads((BASELINE / "input.json").read_text())["data"]
+    expected = json.loads((BASELINE / "output.json").read_text())
+    if asyncio.run(transform.transform(baseline_input)) != expected:
+        raise SystemExit("The transform doesn't match tests/oc_interfaces/baseline/output.json")
+    if json.loads("".join(iter_json(baseline_input))) != expected:
+        raise SystemExit("The streamed JSON doesn't match tests/oc_interfaces/baseline/output.json")
+    print("Baseline output identical")
+
+    data = build_input(args.interfaces, args.addresses)
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        payload = asyncio.run(transform.transform(data))
+    transform_duration = (time.perf_counter() - start) / args.iterations
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        _ = json.dumps(payload)
+    dumps_duration = (time.perf_counter() - start) / args.iterations
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        size = sum(len(chunk) for chunk in iter_json(data))
+    stream_duration = (time.perf_counter() - start) / args.iterations
+
+    if json.loads("".join(iter_json(data))) != payload:
+        raise SystemExit("The streamed JSON doesn't match the transform payload")
+    print(
+        f"{args.interfaces} interfaces: transform {transform_duration * 1000:.1f}ms, "
+        f"transform + json.dumps {(transform_duration + dumps_duration) * 1000:.1f}ms, "
+        f"streamed JSON {stream_duration * 1000:.1f}ms ({size / 1e6:.1f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark of the policy flow simulator on a synthetic rule set.
+
+    python scripts/benchmark_policy_simulator.py --rules 3000 --flows 1000000
+"""
+import argparse
+import random
+import sys
+import time
+
+from ipaddress import IPv4Address
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "generators"))
+
+from policy_compiler import AddressMatch, CompiledRule, IntervalSet, ServiceMatch  # noqa: E402
+from policy_simulator import PolicySimulator  # noqa: E402
+
+ZONES = ["trust", "untrust", "dmz", "mgmt"]
+PROTOCOLS = [6, 17]
+
+
+def random_addresses(rng: random.Random) -> AddressMatch:
+    if rng.random() < 0.1:
+        return AddressMatch(any=True)
+    intervals = []
+    for _ in range(rng.randint(1, 8)):
+        prefixlen = rng.choice([8, 16, 24, 32])
+        size = 1 << (32 - prefixlen)
+        start = rng.randrange(0, 1 << 32) // size * size
+        intervals.append((start, start + size - 1))
+    return AddressMatch(addresses=IntervalSet.from_intervals(intervals))
+
+
+def random_services(rng: random.Random) -> ServiceMatch:
+    if rng.random() < 0.1:
+        return ServiceMatch(any=True)
+    match = ServiceMatch()
+    for _ in range(rng.randint(1, 4)):
+        start = rng.randrange(0, 65535)
+        end = start if rng.random() < 0.7 else min(65535, start + rng.randrange(1, 1024))
+        match = match | ServiceMatch(ports=((rng.choice(PROTOCOLS), IntervalSet.from_intervals([(start, end)])),))
+    return match
+
+
+def build_rules(count: int, rng: random.Random):
+    return [
+        (
+            index,
+            CompiledRule(
+                id=str(index),
+                name=f"rule-{index}",
+                action=rng.choice(["permit", "deny"]),
+                source_zone=rng.choice(ZONES),
+                destination_zone=rng.choice(ZONES),
+                source=random_addresses(rng),
+                destination=random_addresses(rng),
+                services=random_services(rng),
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=3000)
+    parser.add_argument("--flows", type=int, default=1_000_000)
+    parser.add_argument("--scalar-flows", type=int, default=2000, help="flows used to time the per-flow path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+
+    start = time.perf_counter()
+    simulator = PolicySimulator(build_rules(args.rules, rng))
+    print(f"Compiled {args.rules} rules in {time.perf_counter() - start:.2f}s")
+
+    source = np_rng.integers(0, 1 << 32, args.flows, dtype=np.uint64)
+    destination = np_rng.integers(0, 1 << 32, args.flows, dtype=np.uint64)
+    protocol = np_rng.choice(PROTOCOLS, args.flows)
+    port = np_rng.integers(0, 65536, args.flows, dtype=np.uint64)
+    source_zone = np.array(ZONES, dtype=object)[np_rng.integers(0, len(ZONES), args.flows)]
+    destination_zone = np.array(ZONES, dtype=object)[np_rng.integers(0, len(ZONES), args.flows)]
+
+    start = time.perf_counter()
+    indexes, _ = simulator.evaluate(source, destination, protocol, port, source_zone, destination_zone)
+    vectorized = time.perf_counter() - start
+    print(
+        f"Vectorized: {args.flows} flows in {vectorized:.2f}s ({args.flows / vectorized:,.0f} flows/s), "
+        f"{np.count_nonzero(indexes >= 0)} matched"
+    )
+
+    sample = min(args.scalar_flows, args.flows)
+    start = time.perf_counter()
+    for position in range(sample):
+        index, _ = simulator.evaluate_flow(
+            str(IPv4Address(int(source[position]))),
+            str(IPv4Address(int(destination[position]))),
+            int(protocol[position]),
+            int(port[position]),
+            source_zone[position],
+            destination_zone[position],
+        )
+        if index != indexes[position]:
+            raise SystemExit(f"Flow {position}: per-flow path matched {index}, vectorized path {indexes[position]}")
+    scalar = time.perf_counter() - start
+    print(f"Per flow: {sample} flows in {scalar:.2f}s ({sample / scalar:,.0f} flows/s), results identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,225 @@
-import requests, os
-from infrahub_sdk import InfrahubClientSync
+"""Download the containerlab topologies and the device startup configs generated by Infrahub.
+
+All the artifacts are listed with paginated queries, and only those whose checksum changed since
+the last run (recorded in a manifest next to the files) are downloaded, several at a time over a
+pool of connections. Files are written atomically.
+
+    python scripts/get_configs.py --output ./generated-configs/clab --concurrency 16
+"""
+import argparse
 import asyncio
+import json
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from infrahub_sdk import Config, InfrahubClient
+from infrahub_sdk.exceptions import ServerNotReachableError, ServerNotResponsiveError
+from infrahub_sdk.types import HTTPMethod
+
+DEFAULT_OUTPUT = "./generated-configs/clab"
+DEFAULT_CONCURRENCY = 16
+PAGE_SIZE = 500
+
+MANIFEST_FILE = ".manifest.json"
+
+TOPOLOGY_DEFINITION = "Containerlab Topology"
+STARTUP_CONFIG_PREFIX = "Startup Config"
+
+ARTIFACTS_QUERY = """
+query Artifacts($offset: Int, $limit: Int) {
+  CoreArtifact(offset: $offset, limit: $limit) {
+    count
+    edges {
+      node {
+        id
+        checksum { value }
+        storage_id { value }
+        definition { node { name { value } } }
+        object {
+          node {
+            id
+            ... on TopologyTopology { name { value } }
+            ... on InfraGenericDevice { name { value } }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class PooledRequester:
+    """Sends the requests of the client over one pool of connections instead of one connection per request."""
+
+    def __init__(self, address: str, limits: httpx.Limits, verify: bool = True) -> None:
+        self.address = address
+        self.http = httpx.AsyncClient(limits=limits, verify=verify)
+
+    async def __call__(
+        self, url: str, method: HTTPMethod, headers: dict, timeout: int, payload: Optional[dict] = None
+    ) -> httpx.Response:
+        try:
+            return await self.http.request(
+                method=method.value, url=url, headers=headers, timeout=timeout, json=payload or None
+            )
+        except httpx.NetworkError as exc:
+            raise ServerNotReachableError(address=self.address) from exc
+        except httpx.ReadTimeout as exc:
+            raise ServerNotResponsiveError(url=url, timeout=timeout) from exc
+
+    async def close(self) -> None:
+        await self.http.aclose()
+
+
+def get_artifact_path(output: Path, artifact: dict) -> Optional[Path]:
+    """Returns where an artifact is written, None for the artifacts which aren't downloaded."""
+    definition = artifact["definition"]["node"]["name"]["value"]
+    target = (artifact["object"]["node"] or {}).get("name")
+    if not target:
+        return None
+    if definition == TOPOLOGY_DEFINITION:
+        return output / f"{target['value']}.yml"
+    if definition.startswith(STARTUP_CONFIG_PREFIX):
+        return output / "configs" / "startup" / f"{target['value']}.cfg"
+    return None
+
+
+def write_atomic(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_manifest(output: Path) -> Dict[str, dict]:
+    path = output / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except ValueError:
+        return {}
+
+
+async def list_artifacts(client: InfrahubClient, branch: str) -> List[dict]:
+    artifacts = []
+    offset = 0
+    while True:
+        response = await client.execute_graphql(
+            query=ARTIFACTS_QUERY, variables={"offset": offset, "limit": PAGE_SIZE}, branch_name=branch
+        )
+        page = response["CoreArtifact"]
+        artifacts.extend(edge["node"] for edge in page["edges"])
+        offset += PAGE_SIZE
+        if offset >= page["count"] or not page["edges"]:
+            return artifacts
+
+
+async def download_artifact(
+    client: InfrahubClient, requester: PooledRequester, semaphore: asyncio.Semaphore, artifact: dict, path: Path
+) -> Optional[Exception]:
+    # Not client.object_store.get, which returns the body of error responses other than 401 and 403 as the content
+    url = f"{client.address}/api/storage/object/{artifact['storage_id']['value']}"
+    async with semaphore:
+        try:
+            response = await requester.http.get(url, headers=client.headers, timeout=client.default_timeout)
+            response.raise_for_status()
+        except Exception as exc:
+            return exc
+    write_atomic(path, response.text)
+    return None
+
 
+async def sync_artifacts(output: Path, concurrency: int, branch: str) -> bool:
+    start = time.perf_counter()
+    config = Config()
+    requester = PooledRequester(
+        address=config.address,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        verify=not config.tls_insecure,
+    )
+    client = InfrahubClient(config=Config(requester=requester, max_concurrent_execution=concurrency))
 
+    try:
+        artifacts = await list_artifacts(client, branch)
+        manifest = load_manifest(output)
+        new_manifest: Dict[str, dict] = {}
+        downloads = []
+        unchanged = pending = 0
+        for artifact in artifacts:
+            path = get_artifact_path(output, artifact)
+            if not path:
+                continue
+            key = str(path.relative_to(output))
+            if not artifact["storage_id"]["value"]:
+                # Being generated, the previous version is kept until the next run
+                pending += 1
+                if key in manifest:
+                    new_manifest[key] = manifest[key]
+                continue
+            entry = {"id": artifact["id"], "checksum": artifact["checksum"]["value"]}
+            if manifest.get(key) == entry and path.exists():
+                new_manifest[key] = entry
+                unchanged += 1
+                continue
+            downloads.append((key, entry, artifact, path))
 
-def get_containerlab_topology():
-    directory_path = "./generated-configs/clab"
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(
+            *(download_artifact(client, requester, semaphore, artifact, path) for _, _, artifact, path in downloads)
+        )
+    finally:
+        await requester.close()
 
-    client = InfrahubClientSync()
-    topologies = client.all(kind="TopologyTopology")
+    failed = []
+    for (key, entry, _, _), error in zip(downloads, results):
+        if error:
+            print(f"Failed to download {key}: {error}")
+            failed.append(key)
+            # The previous version, if any, is kept until the next run
+            if key in manifest:
+                new_manifest[key] = manifest[key]
+        else:
+            new_manifest[key] = entry
 
-    for topology in topologies:
-        artifact = topology.artifact_fetch("Containerlab Topology")
-        with open(f'{directory_path}/{topology.name.value}.yml', 'w') as file:
-            file.write(artifact)
+    # Files of artifacts which no longer exist
+    removed = set(manifest) - set(new_manifest)
+    for key in removed:
+        (output / key).unlink(missing_ok=True)
 
-def get_device_configs():
-    directory_path = "./generated-configs/clab/configs/startup"
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
+    write_atomic(output / MANIFEST_FILE, json.dumps(new_manifest, indent=2, sort_keys=True))
+    print(
+        f"{len(new_manifest)} artifacts in {output}: {len(downloads) - len(failed)} downloaded, "
+        f"{unchanged} unchanged, {pending} being generated, {len(failed)} failed, "
+        f"{len(removed)} removed in {time.perf_counter() - start:.2f}s"
+    )
+    return not failed
 
-    client = InfrahubClientSync()
-    devices = client.all(kind="InfraDevice")
 
-    for device in devices:
-        device.artifacts.fetch()
-        for artifact in device.artifacts.peers:
-            if (str(artifact.display_label).startswith("Startup Config")):
-                artifact = device.artifact_fetch(artifact.display_label)
-                with open(f'{directory_path}/{device.name.value}.cfg', 'w') as file:
-                    file.write(artifact)
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="artifacts downloaded at the same time")
+    parser.add_argument("--branch", default="main")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
 
+    if not asyncio.run(sync_artifacts(Path(args.output), args.concurrency, args.branch)):
+        raise SystemExit(1)
 
 
-get_containerlab_topology()
-get_device_configs()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
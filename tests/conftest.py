@@ -0,0 +1,109 @@
+import sys
+
+from pathlib import Path
+from typing import List
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "generators"))
+sys.path.insert(0, str(ROOT / "transforms"))
+sys.path.insert(0, str(ROOT / "checks"))
+
+import create_security_nodes as seed  # noqa: E402
+
+# Policy chain of fra-fw1: the policies of its location and ancestors, then its own policy
+FRA_FW1_POLICIES = [seed.GLOBAL_POLICY, seed.EUROPE_POLICY, seed.FRA_POLICY, seed.FRA_FW1_POLICY]
+FRA_FW1_ZONES = {"outside": "10.0.1.1/24", "inside": "10.0.2.1/24", "dmz": "10.0.3.1/24"}
+
+
+def to_edges(items) -> dict:
+    return {"edges": [{"node": {"id": item.name}} for item in items or []]}
+
+
+@pytest.fixture
+def seed_objects() -> dict:
+    """Response of POLICY_OBJECTS_QUERY for the objects of create_security_nodes, the names used as ids."""
+
+    def protocol_node(service) -> dict:
+        return {"node": {"protocol": {"value": service.ip_protocol.protocol}}}
+
+    addresses = [
+        {"id": prefix.name, "__typename": "SecurityPrefix", "prefix": {"value": str(prefix.prefix)}}
+        for prefix in seed.PREFIXES
+    ] + [
+        {"id": address.name, "__typename": "SecurityIPAddress", "address": {"value": str(address.address)}}
+        for address in seed.ADDRESSES
+    ]
+    services = [
+        {"id": protocol.name, "__typename": "SecurityIPProtocol", "protocol": {"value": protocol.protocol}}
+        for protocol in seed.IP_PROTOCOLS
+    ] + [
+        {"id": service.name, "__typename": "SecurityService", "port": {"value": service.port}, "ip_protocol": protocol_node(service)}
+        for service in seed.SERVICES
+    ]
+    return {
+        "SecurityGenericAddress": {"edges": [{"node": node} for node in addresses]},
+        "SecurityGenericAddressGroup": {
+            "edges": [{"node": {"id": group.name, "addresses": to_edges(group.addresses)}} for group in seed.ADDRESS_GROUPS]
+        },
+        "SecurityGenericService": {"edges": [{"node": node} for node in services]},
+        "SecurityGenericServiceGroup": {
+            "edges": [{"node": {"id": group.name, "services": to_edges(group.services)}} for group in seed.SERVICE_GROUPS]
+        },
+    }
+
+
+@pytest.fixture
+def fra_fw1_rules() -> List[seed.SecurityPolicyRule]:
+    """Seed rules rendered on fra-fw1, in rendered order."""
+    rules = []
+    for policy in FRA_FW1_POLICIES:
+        rules.extend(
+            sorted(
+                (
+                    rule
+                    for rule in seed.RULES
+                    if rule.policy == policy
+                    and rule.source_zone.name in FRA_FW1_ZONES
+                    and rule.destination_zone.name in FRA_FW1_ZONES
+                ),
+                key=lambda rule: rule.index,
+            )
+        )
+    return rules
+
+
+
+@pytest.fixture
+def fra_fw1_device(fra_fw1_rules) -> dict:
+    """fra-fw1 in the shape of DEVICE_RULES_QUERY."""
+    rules = [
+        {
+            "node": {
+                "id": f"{rule.policy.name}:{rule.name}",
+                "index": {"value": index},
+                "name": {"value": rule.name},
+                "action": {"value": rule.action.name},
+                "source_zone": {"node": {"id": rule.source_zone.name, "name": {"value": rule.source_zone.name}}},
+                "destination_zone": {"node": {"id": rule.destination_zone.name, "name": {"value": rule.destination_zone.name}}},
+                "source_address": to_edges(rule.source_addresses),
+                "source_groups": to_edges(rule.source_groups),
+                "destination_address": to_edges(rule.destination_addresses),
+                "destination_groups": to_edges(rule.destination_groups),
+                "destination_services": to_edges(rule.destination_services),
+                "destination_service_groups": to_edges(rule.destination_service_groups),
+            }
+        }
+        for index, rule in enumerate(fra_fw1_rules)
+    ]
+    interfaces = [
+        {
+            "node": {
+                "security_zone": {"node": {"name": {"value": zone}}},
+                "ip_addresses": {"edges": [{"node": {"address": {"value": address}}}]},
+            }
+        }
+        for zone, address in FRA_FW1_ZONES.items()
+    ]
+    return {"id": "fra-fw1", "rules": {"edges": rules}, "interfaces": {"edges": interfaces}}
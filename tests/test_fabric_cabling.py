@@ -0,0 +1,100 @@
+import pytest
+
+from check_fabric_cabling import FabricGraph, InfrahubCheckFabricCabling
+
+# Interface -> interface it's cabled to and its address, every spine is cabled to every leaf
+FABRIC = {
+    "spine1:Ethernet1": ("leaf1:Ethernet1", "10.1.0.0/31"),
+    "spine1:Ethernet2": ("leaf2:Ethernet1", "10.1.0.2/31"),
+    "spine2:Ethernet1": ("leaf1:Ethernet2", "10.1.0.4/31"),
+    "spine2:Ethernet2": ("leaf2:Ethernet2", "10.1.0.6/31"),
+    "leaf1:Ethernet1": ("spine1:Ethernet1", "10.1.0.1/31"),
+    "leaf1:Ethernet2": ("spine2:Ethernet1", "10.1.0.5/31"),
+    "leaf2:Ethernet1": ("spine1:Ethernet2", "10.1.0.3/31"),
+    "leaf2:Ethernet2": ("spine2:Ethernet2", "10.1.0.7/31"),
+}
+
+
+def build_devices(cabling: dict) -> list:
+    """Devices in the shape of the check_fabric_cabling query, the interface names used as ids."""
+    devices = {}
+    for port, (peer, address) in cabling.items():
+        device_name, interface_name = port.split(":")
+        interfaces = devices.setdefault(device_name, [])
+        interfaces.append(
+            {
+                "node": {
+                    "id": port,
+                    "name": {"value": interface_name},
+                    "role": {"value": "backbone"},
+                    "connected_endpoint": {"node": {"id": peer} if peer else None},
+                    "ip_addresses": {"edges": [{"node": {"address": {"value": address}}}] if address else []},
+                }
+            }
+        )
+    return [
+        {"name": {"value": name}, "role": {"value": name.rstrip("0123456789")}, "interfaces": {"edges": interfaces}}
+        for name, interfaces in devices.items()
+    ]
+
+
+def validate(cabling: dict) -> list:
+    check = InfrahubCheckFabricCabling(branch="main")
+    check.validate({"topologies": {"fra05-pod1": build_devices(cabling)}})
+    return [log["message"] for log in check.logs]
+
+
+def test_fabric():
+    graph = FabricGraph(build_devices(FABRIC))
+
+    assert graph.missing_spine_leaf_links() == []
+    assert graph.asymmetric_links() == []
+    assert graph.ip_pairing_errors() == []
+    assert validate(FABRIC) == []
+
+
+def test_missing_spine_uplink():
+    cabling = dict(FABRIC)
+    del cabling["spine2:Ethernet2"]
+    del cabling["leaf2:Ethernet2"]
+
+    assert FabricGraph(build_devices(cabling)).missing_spine_leaf_links() == [("spine2", "leaf2")]
+    assert validate(cabling) == ["fra05-pod1: spine2 is not connected to leaf2."]
+
+
+def test_duplicate_link():
+    # A second leaf1 interface cabled to the spine1 interface of the first one
+    cabling = dict(FABRIC, **{"leaf1:Ethernet3": ("spine1:Ethernet1", None)})
+
+    assert FabricGraph(build_devices(cabling)).asymmetric_links() == [("leaf1:Ethernet3", "spine1:Ethernet1")]
+    assert validate(cabling) == [
+        "fra05-pod1: leaf1:Ethernet3 is connected to spine1:Ethernet1, but spine1:Ethernet1 is not connected back."
+    ]
+
+
+def test_leaf_cabled_to_leaf():
+    # The spine2 uplinks of the leaves cabled to each other instead
+    cabling = dict(FABRIC)
+    cabling["spine2:Ethernet1"] = (None, None)
+    del cabling["spine2:Ethernet2"]
+    cabling["leaf1:Ethernet2"] = ("leaf2:Ethernet2", "10.1.0.4/31")
+    cabling["leaf2:Ethernet2"] = ("leaf1:Ethernet2", "10.1.0.5/31")
+
+    assert FabricGraph(build_devices(cabling)).missing_spine_leaf_links() == [("spine2", "leaf1"), ("spine2", "leaf2")]
+    assert validate(cabling) == [
+        "fra05-pod1: spine2 is not connected to leaf1.",
+        "fra05-pod1: spine2 is not connected to leaf2.",
+    ]
+
+
+@pytest.mark.parametrize(
+    "address, error",
+    [
+        ("10.1.0.9/31", "spine1:Ethernet1 <-> leaf1:Ethernet1 are addressed in different prefixes."),
+        (None, "Only one end of spine1:Ethernet1 <-> leaf1:Ethernet1 has an IP address."),
+    ],
+)
+def test_ip_pairing(address, error):
+    cabling = dict(FABRIC, **{"leaf1:Ethernet1": ("spine1:Ethernet1", address)})
+
+    assert validate(cabling) == [f"fra05-pod1: {error}"]
@@ -0,0 +1,101 @@
+from create_security_nodes import (
+    ANY,
+    BLOCK_INTERNET,
+    GLOBAL_POLICY,
+    HTTP,
+    SMTP_SERVERS,
+    ZONE_INSIDE,
+    ZONE_OUTSIDE,
+    PolicyAction,
+    SecurityPolicyRule,
+)
+from policy_compiler import CompiledRule, IntervalSet, ServiceMatch, build_object_catalog, eliminate_covered_rules
+
+
+def compile_rule(catalog, rule, name=None) -> CompiledRule:
+    def names(items):
+        return [item.name for item in items or []]
+
+    return CompiledRule(
+        id=name or rule.name,
+        name=name or rule.name,
+        action=rule.action.name,
+        source_zone=rule.source_zone.name,
+        destination_zone=rule.destination_zone.name,
+        source=catalog.expand_addresses(names(rule.source_addresses), names(rule.source_groups)),
+        destination=catalog.expand_addresses(names(rule.destination_addresses), names(rule.destination_groups)),
+        services=catalog.expand_services(names(rule.destination_services), names(rule.destination_service_groups)),
+    )
+
+
+def make_rule(name, action, destination_addresses=None, destination_groups=None, destination_services=None):
+    return SecurityPolicyRule(
+        index=0,
+        name=name,
+        policy=GLOBAL_POLICY,
+        action=PolicyAction[action],
+        source_zone=ZONE_INSIDE,
+        destination_zone=ZONE_OUTSIDE,
+        destination_addresses=destination_addresses,
+        destination_groups=destination_groups,
+        destination_services=destination_services,
+    )
+
+
+def test_any_address_is_the_whole_network(seed_objects):
+    catalog = build_object_catalog(seed_objects)
+
+    assert catalog.addresses["ANY"].addresses == IntervalSet(((0, 2**32 - 1),))
+    assert catalog.addresses["SMTP_SERVER_1"].addresses == IntervalSet(((0x0A000001, 0x0A000001),))
+
+
+def test_ip_protocol_without_number_is_any_service(seed_objects):
+    catalog = build_object_catalog(seed_objects)
+
+    assert catalog.services["IP"] == ServiceMatch(any=True)
+    assert catalog.services["IP"].covers(catalog.services["SSH"])
+    assert not catalog.services["ICMP"].covers(catalog.services["SSH"])
+
+
+def test_rule_covered_by_any_is_redundant(seed_objects):
+    catalog = build_object_catalog(seed_objects)
+    rules = [
+        compile_rule(catalog, make_rule("permit-any-http", "permit", destination_addresses=[ANY], destination_services=[HTTP])),
+        compile_rule(catalog, make_rule("permit-smtp-http", "permit", destination_groups=[SMTP_SERVERS], destination_services=[HTTP])),
+    ]
+
+    kept, eliminated, conflicts = eliminate_covered_rules(rules)
+
+    assert [rule.name for rule in kept] == ["permit-any-http"]
+    assert [(item.rule.name, item.covered_by.name) for item in eliminated] == [("permit-smtp-http", "permit-any-http")]
+    assert not conflicts
+
+
+def test_rule_covered_by_another_action_is_kept(seed_objects):
+    catalog = build_object_catalog(seed_objects)
+    rules = [
+        compile_rule(catalog, make_rule("deny-block-internet-http", "deny", destination_groups=[BLOCK_INTERNET], destination_services=[HTTP])),
+        compile_rule(catalog, make_rule("permit-any-http", "permit", destination_addresses=[ANY], destination_services=[HTTP])),
+    ]
+
+    kept, eliminated, conflicts = eliminate_covered_rules(rules)
+
+    assert [rule.name for rule in kept] == ["deny-block-internet-http", "permit-any-http"]
+    assert not eliminated
+    assert [(item.rule.name, item.covered_by.name) for item in conflicts] == [("permit-any-http", "deny-block-internet-http")]
+
+
+def test_seed_policy(seed_objects, fra_fw1_rules):
+    catalog = build_object_catalog(seed_objects)
+    rules = [compile_rule(catalog, rule, name=f"{rule.policy.name}:{rule.name}") for rule in fra_fw1_rules]
+
+    kept, eliminated, conflicts = eliminate_covered_rules(rules)
+
+    assert [(item.rule.name, item.covered_by.name) for item in eliminated] == [
+        ("EUROPE_POLICY:permit-inbound-smtp", "GLOBAL_POLICY:permit-inbound-smtp"),
+    ]
+    # The smtp servers are denied any IP traffic to outside before icmp is permitted
+    assert [(item.rule.name, item.covered_by.name) for item in conflicts] == [
+        ("EUROPE_POLICY:permit-smpt-servers-icmp", "GLOBAL_POLICY:deny-smtp-servers-outbound"),
+    ]
+    assert len(kept) == len(rules) - 1
@@ -0,0 +1,56 @@
+from ipaddress import ip_address
+
+import numpy as np
+import pytest
+
+from policy_compiler import build_object_catalog
+from policy_simulator import NO_MATCH, PolicySimulator
+
+# (source, destination, protocol, port, source zone, destination zone) -> (rule, action) on fra-fw1
+SEED_FLOWS = [
+    (("1.2.3.4", "10.0.0.1", 6, 25, "outside", "dmz"), ("permit-inbound-smtp", "permit")),
+    (("1.2.3.4", "10.0.3.5", 6, 22, "outside", "dmz"), ("deny-block-internet-dmz", "deny")),
+    (("1.2.3.4", "10.0.2.5", 17, 53, "outside", "inside"), ("deny-block-internet-internal", "deny")),
+    (("10.0.0.1", "8.8.8.8", 1, 0, "dmz", "outside"), ("deny-smtp-servers-outbound", "deny")),
+    (("10.0.1.1", "8.8.8.8", 6, 443, "dmz", "outside"), ("permit-web-proxies-outbound", "permit")),
+    (("10.0.1.1", "8.8.8.8", 17, 53, "dmz", "outside"), ("deny-web-proxies-ip-outbound", "deny")),
+    (("10.0.2.5", "10.0.1.1", 6, 8080, "inside", "dmz"), ("permit-internal-to-webproxies", "permit")),
+    (("10.0.2.5", "10.0.0.1", 6, 22, "inside", "dmz"), ("permit-internal-ssh-smtp-servers", "permit")),
+    (("10.0.2.5", "8.8.8.8", 6, 443, "inside", "outside"), ("deny-internal-block-internet", "deny")),
+    (("10.0.2.5", "10.0.1.1", 6, 80, "inside", "dmz"), (None, NO_MATCH)),
+    # Zones of the firewall interface subnets
+    (("10.0.2.5", "10.0.1.7", 6, 443, None, None), ("deny-internal-block-internet", "deny")),
+]
+
+
+@pytest.fixture
+def simulator(seed_objects, fra_fw1_device) -> PolicySimulator:
+    return PolicySimulator.from_device_data(build_object_catalog(seed_objects), fra_fw1_device)
+
+
+def expected_index(fra_fw1_rules, name) -> int:
+    # Rule names repeat across the policies of the chain, the first one is rendered first
+    return next((index for index, rule in enumerate(fra_fw1_rules) if rule.name == name), -1)
+
+
+@pytest.mark.parametrize("flow, expected", SEED_FLOWS)
+def test_evaluate_flow(simulator, fra_fw1_rules, flow, expected):
+    name, action = expected
+
+    assert simulator.evaluate_flow(*flow) == (expected_index(fra_fw1_rules, name), action)
+
+
+def test_evaluate(simulator, fra_fw1_rules):
+    flows = [flow for flow, _ in SEED_FLOWS]
+    indexes, actions = simulator.evaluate(
+        source=np.array([int(ip_address(flow[0])) for flow in flows], dtype=np.uint64),
+        destination=np.array([int(ip_address(flow[1])) for flow in flows], dtype=np.uint64),
+        protocol=np.array([flow[2] for flow in flows]),
+        port=np.array([flow[3] for flow in flows]),
+        # Flows without zones are given the zones of the firewall interfaces
+        source_zone=np.array([flow[4] or simulator.find_zone(flow[0]) for flow in flows], dtype=object),
+        destination_zone=np.array([flow[5] or simulator.find_zone(flow[1]) for flow in flows], dtype=object),
+    )
+
+    assert indexes.tolist() == [expected_index(fra_fw1_rules, name) for _, (name, _) in SEED_FLOWS]
+    assert actions.tolist() == [action for _, (_, action) in SEED_FLOWS]
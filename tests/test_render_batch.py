@@ -0,0 +1,112 @@
+import copy
+import json
+
+import pytest
+
+from conftest import ROOT
+from render_batch import BatchContext, get_renderers, get_topology_renderer
+
+FIXTURES = ROOT / "tests"
+
+
+def load_input(name: str) -> dict:
+    return json.loads((FIXTURES / name / "baseline" / "input.json").read_text())["data"]
+
+
+def load_output(name: str, extension: str = "txt") -> str:
+    return (FIXTURES / name / "baseline" / f"output.{extension}").read_text()
+
+
+def get_renderer(name: str):
+    return next(renderer for renderers in get_renderers().values() for renderer in renderers if renderer.name == name)
+
+
+def add_device(context: BatchContext, device_id: str, node: dict, topology_id: str = None, location_id: str = None) -> None:
+    """Splits a device of the per-device queries into the parts shared by the batch."""
+    device = dict(node)
+    for name, related_id, parts in (("topology", topology_id, context.topologies), ("location", location_id, context.locations)):
+        if name not in node:
+            continue
+        if node[name]["node"] is not None:
+            parts[related_id] = node[name]["node"]
+        device[name] = {"node": {"id": related_id} if node[name]["node"] is not None else None}
+    context.devices[device_id] = device
+
+
+def device_info_context() -> BatchContext:
+    data = load_input("device_arista")
+    context = BatchContext()
+    add_device(context, "leaf1", data["InfraDevice"]["edges"][0]["node"], "fra05-pod1", "fra05")
+    context.vrfs = data["InfraVRF"]["edges"]
+    return context
+
+
+def test_device_info():
+    context = device_info_context()
+
+    assert context.data("device_info", "leaf1") == load_input("device_arista")
+    assert get_renderer("AristaConfig").render(context.data("device_info", "leaf1")) == load_output("device_arista")
+
+
+def test_oc_interfaces():
+    context = BatchContext()
+    node = load_input("oc_interfaces")["InfraDevice"]["edges"][0]["node"]
+    # The batch query reads the topology and location of every device
+    add_device(context, "leaf1", dict(node, topology={"node": None}, location={"node": None}))
+
+    output = get_renderer("OCInterfaces").render(context.data("device_info", "leaf1"))
+
+    assert json.loads(output) == json.loads(load_output("oc_interfaces", "json"))
+
+
+def test_srx_config():
+    context = BatchContext()
+    add_device(context, "fw1", load_input("srx_config")["SecurityFirewall"]["edges"][0]["node"])
+
+    assert context.data("srx_config", "fw1") == load_input("srx_config")
+    assert get_renderer("SRXConfig").render(context.data("srx_config", "fw1")) == load_output("srx_config")
+
+
+def test_topology_info():
+    context = BatchContext()
+    for index, edge in enumerate(load_input("clab_topology")["InfraDevice"]["edges"]):
+        add_device(context, f"device{index}", edge["node"])
+        context.topology_devices.setdefault("fra05-pod1", []).append(f"device{index}")
+
+    assert context.data("topology_info", "fra05-pod1") == load_input("clab_topology")
+    assert get_topology_renderer().render(context.data("topology_info", "fra05-pod1")) == load_output("clab_topology")
+
+
+def two_devices_context() -> BatchContext:
+    """leaf1 and a copy of it, leaf2, in the same topology and location."""
+    context = device_info_context()
+    leaf2 = copy.deepcopy(context.devices["leaf1"])
+    leaf2["name"]["value"] = "fra05-pod1-leaf2"
+    context.devices["leaf2"] = leaf2
+    return context
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        pytest.param(lambda context: context.topologies["fra05-pod1"]["network_services"]["edges"].pop(), id="topology"),
+        pytest.param(lambda context: context.locations["fra05"]["timezone"].update(value="Europe/Berlin"), id="location"),
+        pytest.param(lambda context: context.vrfs.pop(), id="vrfs"),
+    ],
+)
+def test_data_hash_changes_with_shared_parts(change):
+    before = two_devices_context()
+    after = two_devices_context()
+    change(after)
+
+    assert after.data_hash("device_info", "leaf1") != before.data_hash("device_info", "leaf1")
+    assert after.data_hash("device_info", "leaf2") != before.data_hash("device_info", "leaf2")
+
+
+def test_data_hash_ignores_other_devices():
+    before = two_devices_context()
+    after = two_devices_context()
+    after.devices["leaf2"]["asn"]["node"]["asn"]["value"] = 65000
+
+    assert after.data_hash("device_info", "leaf1") == before.data_hash("device_info", "leaf1")
+    assert after.data_hash("device_info", "leaf2") != before.data_hash("device_info", "leaf2")
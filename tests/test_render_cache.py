@@ -0,0 +1,51 @@
+import json
+
+from render_cache import STATS_FILE, RenderCache
+
+
+def test_miss_then_hit(tmp_path):
+    cache = RenderCache(tmp_path)
+
+    assert cache.get("AristaConfig", "code", "data") is None
+    cache.set("AristaConfig", "code", "data", "hostname leaf1")
+
+    assert cache.get("AristaConfig", "code", "data") == "hostname leaf1"
+    assert (cache.hits["AristaConfig"], cache.misses["AristaConfig"]) == (1, 1)
+    assert cache.hit_rate("AristaConfig") == 0.5
+
+
+def test_key_includes_code_hash(tmp_path):
+    cache = RenderCache(tmp_path)
+    cache.set("AristaConfig", "code", "data", "hostname leaf1")
+
+    assert cache.get("AristaConfig", "other code", "data") is None
+    assert cache.get("OCInterfaces", "code", "data") is None
+    assert cache.misses["AristaConfig"] == 1
+
+
+def test_save_adds_to_stats(tmp_path):
+    first = RenderCache(tmp_path)
+    first.get("AristaConfig", "code", "data")
+    first.set("AristaConfig", "code", "data", "hostname leaf1")
+    first.save()
+
+    second = RenderCache(tmp_path)
+    second.get("AristaConfig", "code", "data")
+    second.get("SRXConfig", "code", "data")
+    stats = second.save()
+
+    expected = {"AristaConfig": {"hits": 1, "misses": 1}, "SRXConfig": {"hits": 0, "misses": 1}}
+    assert stats == expected
+    assert json.loads((tmp_path / STATS_FILE).read_text()) == expected
+
+
+def test_save_removes_stale_entries(tmp_path):
+    cache = RenderCache(tmp_path)
+    cache.set("AristaConfig", "code", "data", "hostname leaf1")
+    cache.save()
+    assert cache.get("AristaConfig", "code", "data") == "hostname leaf1"
+
+    cache.save(max_age=0)
+
+    assert cache.get("AristaConfig", "code", "data") is None
+    assert (tmp_path / STATS_FILE).exists()
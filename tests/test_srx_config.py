@@ -0,0 +1,33 @@
+import asyncio
+import json
+import re
+
+from conftest import ROOT
+from srx_config import SRXConfig, iter_interfaces
+
+FIXTURES = ROOT / "tests"
+
+
+def normalize_template_output(output: str) -> list:
+    """Lines of the juniper_srx_config.j2 output without the deviations SRXConfig fixes."""
+    lines = []
+    for line in output.splitlines():
+        # The template joined the match statements and the first interface on one line
+        for statement in re.split(r"(?<=[;{])\s+(?=\S)", line.strip()):
+            statement = statement.replace("addresss ", "address ")
+            lines.append(re.sub(r"^(address-set \S+)\{$", r"\1 {", statement))
+    return [line for line in lines if line]
+
+
+def test_matches_template():
+    data = json.loads((FIXTURES / "srx_config" / "baseline" / "input.json").read_text())["data"]
+    output = asyncio.run(SRXConfig().transform(data))
+    expected = (FIXTURES / "firewall_config" / "baseline" / "output.txt").read_text()
+
+    assert [line.strip() for line in output.splitlines()] == normalize_template_output(expected)
+
+
+def test_interface_without_address():
+    interfaces = [{"name": {"value": "ge-0/0/5"}, "ip_addresses": {"edges": []}}]
+
+    assert list(iter_interfaces(interfaces)) == ["interfaces {", "    ge-0/0/5 {", "        unit 0 {", "            family inet;", "        }", "    }", "}"]
@@ -0,0 +1,193 @@
+from typing import List, Optional
+
+from infrahub_sdk.transforms import InfrahubTransform
+
+# Python version of templates/device_arista_config.tpl.j2, the output is kept byte for byte identical.
+# The device is indexed once (management servers, loopback and management addresses, VLAN services)
+# instead of looping over the interfaces and the network services for each section.
+
+HEADER = """vlan internal order ascending range 1006 1199
+!
+transceiver qsfp default-mode 4x10G
+!
+service routing protocols model multi-agent
+!"""
+
+SYSTEM = """dns domain atd.lab
+!
+spanning-tree mode mstp
+no spanning-tree vlan-id 4093-4094
+spanning-tree mst 0 priority 16384
+!
+no enable password
+no aaa root
+!"""
+
+MLAG_VLANS = """vlan 4093
+   name LEAF_PEER_L3
+   trunk group LEAF_PEER_L3
+!
+vlan 4094
+   name MLAG_PEER
+   trunk group MLAG
+!"""
+
+VXLAN = """   vxlan source-interface Loopback1
+   vxlan virtual-router encapsulation mac-address mlag-system-id
+   vxlan udp-port 4789"""
+
+BGP = """   maximum-paths 4 ecmp 4
+   update wait-install
+   no bgp default ipv4-unicast
+   no update wait-install
+   no bgp default ipv4-unicast
+!"""
+
+MANAGEMENT_API = """management api http-commands
+   protocol https
+   no shutdown
+   !
+   vrf default
+      no shutdown
+!
+end
+"""
+
+POINT_TO_POINT_ROLES = ("peer", "backbone")
+
+
+class DeviceIndex:
+    """Values looked up by several sections of the configuration, computed in one pass over the device."""
+
+    def __init__(self, device: dict) -> None:
+        self.ntp_servers: List[str] = []
+        self.name_servers: List[str] = []
+        self.loopback_ip: Optional[str] = None
+        self.management_gw_ip: Optional[str] = None
+        # (vlan, service) of the network services of the topology which have a VLAN
+        self.vlan_services: List[tuple] = []
+
+        for ancestor in device["location"]["node"]["ancestors"]["edges"]:
+            for server in ancestor["node"]["network_management_servers"]["edges"]:
+                if server["node"]["__typename"] == "NetworkNTPServer":
+                    self.ntp_servers.append(server["node"]["name"]["value"])
+                elif server["node"]["__typename"] == "NetworkNameServer":
+                    self.name_servers.append(server["node"]["name"]["value"])
+
+        # The last loopback and management interfaces with an address win, like in the template
+        for interface in device["interfaces"]["edges"]:
+            role = interface["node"]["role"]["value"]
+            if role not in ("loopback", "management"):
+                continue
+            addresses = (interface["node"].get("ip_addresses") or {}).get("edges")
+            if not addresses:
+                continue
+            if role == "loopback":
+                self.loopback_ip = addresses[0]["node"]["address"]["ip"]
+            elif addresses[0]["node"].get("ip_prefix"):
+                broadcast_address = addresses[0]["node"]["ip_prefix"]["node"]["prefix"]["broadcast_address"]
+                octets = broadcast_address.split(".")
+                self.management_gw_ip = f"{octets[0]}.{octets[1]}.{octets[2]}.{int(octets[3]) - 1}"
+
+        for service in device["topology"]["node"]["network_services"]["edges"]:
+            if service["node"].get("vlan"):
+                self.vlan_services.append((service["node"]["vlan"]["node"], service["node"]))
+
+
+def render_interface(interface: dict) -> List[str]:
+    lines = [f"interface {interface['name']['value']}"]
+    if interface["description"]["value"]:
+        lines.append(f'   description "{interface["description"]["value"]}"')
+    if not interface["enabled"]["value"]:
+        lines.append("   shutdown")
+    if interface["mtu"]["value"]:
+        lines.append(f"   mtu {interface['mtu']['value']}")
+
+    role = interface["role"]["value"]
+    if interface.get("ip_addresses"):
+        for ip in interface["ip_addresses"]["edges"]:
+            lines.append(f"   ip address {ip['node']['address']['value']}")
+            lines.append("   no switchport")
+            if role in POINT_TO_POINT_ROLES:
+                lines.append("   ip ospf network point-to-point")
+    else:
+        lines.append("   switchport mode trunk")
+        if interface.get("tagged_vlan"):
+            lines.append(f"   switchport trunk native vlan {interface['untagged_vlan']['node']['vlan_id']['value']}")
+            vlan_ids = ", ".join(f" {vlan['node']['vlan_id']['value']}" for vlan in interface["tagged_vlan"]["edges"])
+            lines.append(f"   switchport trunk allowed vlan {vlan_ids}")
+        if role == "server":
+            lines.append("   spanning-tree portfast")
+    lines.append("!")
+    return lines
+
+
+def render_config(data: dict) -> str:
+    if not data["InfraDevice"]["edges"]:
+        return ""
+
+    device = data["InfraDevice"]["edges"][0]["node"]
+    vrfs = [vrf["node"] for vrf in data["InfraVRF"]["edges"]]
+    index = DeviceIndex(device)
+    name = device["name"]["value"]
+
+    lines = [HEADER, f"hostname {name}", SYSTEM]
+    lines.extend(f"ntp server {server}" for server in index.ntp_servers)
+    lines.append("!")
+    lines.extend(f"ip name-server {server}" for server in index.name_servers)
+
+    lines.append("! Vlan Configuration")
+    for vlan, _ in index.vlan_services:
+        lines.extend([f"vlan {vlan['vlan_id']['value']}", f"   name {vlan['name']['value']}", "!"])
+    lines.append(MLAG_VLANS)
+
+    lines.append("! VRF Configuration")
+    for vrf in vrfs:
+        lines.extend([f"vrf instance {vrf['name']['value']}", "!"])
+    lines.append("!")
+
+    lines.append("! Interface Configuration")
+    for interface in device["interfaces"]["edges"]:
+        lines.extend(render_interface(interface["node"]))
+
+    lines.extend(["interface Vxlan1", f'   description "VTEP on {name}"', VXLAN])
+    for vlan, service in index.vlan_services:
+        vlan_id = vlan["vlan_id"]["value"]
+        if service["service_type"]["value"] == "Layer2":
+            lines.append(f"   vxlan vlan {vlan_id} vni 201{vlan_id}")
+        elif service["service_type"]["value"] == "Layer3" and service["prefix"]["node"]:
+            vrf_rd = service["prefix"]["node"]["vrf"]["node"]["vrf_rd"]["value"]
+            lines.append(f"   vxlan vlan {vlan_id} vni {vrf_rd}{vlan_id}")
+    lines.extend(f"   vxlan vrf {vrf['name']['value']} vni {vrf['vrf_rd']['value']}" for vrf in vrfs)
+    lines.append("!")
+
+    lines.append("ip routing")
+    lines.extend(f"ip routing vrf {vrf['name']['value']}" for vrf in vrfs)
+    lines.append("!")
+    lines.append(f"ip route 0.0.0.0/0 {index.management_gw_ip or ''}")
+    lines.append("!")
+
+    if device.get("asn"):
+        lines.extend([f"router bgp {device['asn']['node']['asn']['value']}", f"   router-id {index.loopback_ip}", BGP])
+        for vrf in vrfs:
+            lines.extend(
+                [
+                    f"   vrf {vrf['name']['value']}",
+                    f"   rd {index.loopback_ip}:{vrf['vrf_rd']['value']}",
+                    f"   route-target import evpn {vrf['import_rt']['node']['name']['value']}",
+                    f"   route-target export evpn {vrf['export_rt']['node']['name']['value']}",
+                    f"   router-id {index.loopback_ip}",
+                    "   redistribute connected",
+                    "!",
+                ]
+            )
+    lines.append(MANAGEMENT_API)
+    return "\n".join(lines)
+
+
+class AristaConfig(InfrahubTransform):
+
+    query = "device_info"
+
+    async def transform(self, data):
+        return render_config(data)
@@ -0,0 +1,79 @@
+from typing import Iterator
+
+from infrahub_sdk.transforms import InfrahubTransform
+
+# Python version of topology/clab_topology.j2, with the same output.
+# Links are deduplicated with a set of sorted endpoint pairs in a single pass over the interfaces.
+
+HEADER = """name: avdasymirb
+
+topology:
+  kinds:
+    ceos:
+      image: "${CEOS_DOCKER_IMAGE}"
+      exec:
+        - sleep 10
+        - FastCli -p 15 -c 'security pki key generate rsa 4096 eAPI.key'
+        - FastCli -p 15 -c 'security pki certificate generate self-signed eAPI.crt key eAPI.key generate rsa 4096 validity 30000 parameters common-name eAPI'
+    linux:
+      image: "${LINUX_HOST_DOCKER_IMAGE}"
+  nodes:"""
+
+FOOTER = """
+mgmt:
+  network: ceos_clab
+  ipv4-subnet: 172.16.0.0/16
+  ipv6-subnet: 2001:172:16::/80"""
+
+
+def iter_nodes(devices: list) -> Iterator[str]:
+    for device in devices:
+        name = device["name"]["value"]
+        networkos = device["device_type"]["node"]["platform"]["node"]["containerlab_os"]["value"]
+        yield f"    {name}:"
+        yield f"      kind: {networkos}"
+        for interface in device["interfaces"]["edges"]:
+            if interface["node"]["role"]["value"] == "management":
+                management_ip = interface["node"]["ip_addresses"]["edges"][0]["node"]["address"]["value"]
+                yield f"      mgmt-ipv4: {management_ip.split('/')[0]}"
+        if networkos == "ceos":
+            yield f"      startup-config: configs/startup/{name}.cfg"
+        if networkos == "linux":
+            yield "      env:"
+            yield "        TMODE: lacp"
+
+
+def iter_links(devices: list) -> Iterator[str]:
+    processed_endpoints = set()
+    for device in devices:
+        for interface in device["interfaces"]["edges"]:
+            connected_endpoint = (interface["node"].get("connected_endpoint") or {}).get("node")
+            if connected_endpoint is None:
+                continue
+            endpoint1 = f"{device['name']['value']}:{interface['node']['name']['value']}"
+            endpoint2 = f"{connected_endpoint['device']['node']['name']['value']}:{connected_endpoint['name']['value']}"
+            endpoint_key = (endpoint1, endpoint2) if endpoint1 <= endpoint2 else (endpoint2, endpoint1)
+            if endpoint_key in processed_endpoints:
+                continue
+            processed_endpoints.add(endpoint_key)
+            endpoint1 = endpoint1.replace("Ethernet", "eth")
+            endpoint2 = endpoint2.replace("Ethernet", "eth")
+            yield f'    - endpoints: ["{endpoint1}", "{endpoint2}"]'
+
+
+def iter_topology(data: dict) -> Iterator[str]:
+    devices = [device["node"] for device in data["InfraDevice"]["edges"]]
+    yield HEADER
+    yield from iter_nodes(devices)
+    yield ""
+    yield "  links:"
+    yield from iter_links(devices)
+    yield FOOTER
+
+
+class ClabTopology(InfrahubTransform):
+
+    query = "topology_info"
+
+    async def transform(self, data):
+        return "\n".join(iter_topology(data))
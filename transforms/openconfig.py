@@ -1,57 +1,73 @@
+import json
+from typing import Iterator
+
 from infrahub_sdk.transforms import InfrahubTransform
 
+INTERFACES_KEY = "openconfig-interfaces:interface"
+IPV4_KEY = "openconfig-if-ip:ipv4"
+
+
+def iter_subinterfaces(ip_edges: list) -> Iterator[dict]:
+    for idx, ip in enumerate(ip_edges):
+        address, _, mask = ip["node"]["address"]["value"].partition("/")
+        yield {
+            "index": idx,
+            IPV4_KEY: {
+                "addresses": {"address": [{"ip": address, "config": {"ip": address, "prefix-length": mask}}]},
+                "config": {"enabled": True},
+            },
+        }
+
+
+def iter_interfaces(data: dict) -> Iterator[dict]:
+    for intf in data["InfraDevice"]["edges"][0]["node"]["interfaces"]["edges"]:
+        node = intf["node"]
+
+        config = {"enabled": node["enabled"]["value"]}
+        description = node.get("description")
+        if description and description["value"]:
+            config["description"] = description["value"]
+        intf_config = {"name": node["name"]["value"], "config": config}
+
+        ip_addresses = node.get("ip_addresses")
+        if ip_addresses:
+            intf_config["subinterfaces"] = {"subinterface": list(iter_subinterfaces(ip_addresses["edges"]))}
+
+        yield intf_config
+
+
+def iter_subinterfaces_json(ip_edges: list) -> Iterator[str]:
+    for idx, ip in enumerate(ip_edges):
+        address, _, mask = ip["node"]["address"]["value"].partition("/")
+        address, mask = json.dumps(address), json.dumps(mask)
+        yield (
+            f'{{"index": {idx}, "{IPV4_KEY}": {{"addresses": {{"address": [{{"ip": {address}, '
+            f'"config": {{"ip": {address}, "prefix-length": {mask}}}}}]}}, "config": {{"enabled": true}}}}}}'
+        )
+
+
+def iter_json(data: dict) -> Iterator[str]:
+    """Yields the JSON document of the transform one interface at a time, without building the payload."""
+    yield f'{{"{INTERFACES_KEY}": ['
+    for position, intf in enumerate(data["InfraDevice"]["edges"][0]["node"]["interfaces"]["edges"]):
+        node = intf["node"]
+        config = f'"enabled": {json.dumps(node["enabled"]["value"])}'
+        description = node.get("description")
+        if description and description["value"]:
+            config += f', "description": {json.dumps(description["value"])}'
+        chunk = f'{", " if position else ""}{{"name": {json.dumps(node["name"]["value"])}, "config": {{{config}}}'
+
+        ip_addresses = node.get("ip_addresses")
+        if ip_addresses:
+            subinterfaces = ", ".join(iter_subinterfaces_json(ip_addresses["edges"]))
+            chunk += f', "subinterfaces": {{"subinterface": [{subinterfaces}]}}'
+        yield chunk + "}"
+    yield "]}"
+
 
 class OCInterfaces(InfrahubTransform):
 
     query = "oc_interfaces"
 
     async def transform(self, data):
-        response_payload = {}
-        response_payload["openconfig-interfaces:interface"] = []
-
-        for intf in data["InfraDevice"]["edges"][0]["node"]["interfaces"]["edges"]:
-
-            intf_name = intf["node"]["name"]["value"]
-
-            intf_config = {
-                "name": intf_name,
-                "config": {"enabled": intf["node"]["enabled"]["value"]},
-            }
-
-            if (
-                intf["node"].get("description", None)
-                and intf["node"]["description"]["value"]
-            ):
-                intf_config["config"]["description"] = intf["node"]["description"][
-                    "value"
-                ]
-
-            if intf["node"].get("ip_addresses", None):
-                intf_config["subinterfaces"] = {"subinterface": []}
-
-                for idx, ip in enumerate(intf["node"]["ip_addresses"]["edges"]):
-
-                    address, mask = ip["node"]["address"]["value"].split("/")
-                    intf_config["subinterfaces"]["subinterface"].append(
-                        {
-                            "index": idx,
-                            "openconfig-if-ip:ipv4": {
-                                "addresses": {
-                                    "address": [
-                                        {
-                                            "ip": address,
-                                            "config": {
-                                                "ip": address,
-                                                "prefix-length": mask,
-                                            },
-                                        }
-                                    ]
-                                },
-                                "config": {"enabled": True},
-                            },
-                        }
-                    )
-
-            response_payload["openconfig-interfaces:interface"].append(intf_config)
-
-        return response_payload
+        return {INTERFACES_KEY: list(iter_interfaces(data))}
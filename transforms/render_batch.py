@@ -0,0 +1,473 @@
+import logging
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import jinja2
+
+from infrahub_sdk import InfrahubClient
+
+from arista_config import render_config as render_arista_config
+from clab_topology import iter_topology
+from openconfig import iter_json as iter_oc_interfaces_json
+from render_cache import RenderCache, canonical_hash, combine_hashes, file_hash
+from srx_config import iter_config as iter_srx_config
+
+# Renders the artifacts of many devices in one process.
+#
+#   - Devices are read with paginated multi-device queries instead of one query per device and artifact
+#   - The topology network services, the location management servers and the VRFs are read once
+#     and shared by all the devices which reference them
+#   - Each device is handed to the renderers in the shape of the per-device queries
+#     (device_info, oc_interfaces, srx_config), so the same transforms and templates are used
+#   - Renders are cached by content hash, a device whose data, transform and template didn't change
+#     isn't rendered again
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PAGE_SIZE = 100
+
+DEFAULT_OUTPUT = "generated-configs/batch"
+DEFAULT_GROUPS = ("arista_devices", "cisco_devices", "firewall_devices")
+
+IP_ADDRESSES_FIELDS = """
+ip_addresses {
+  edges {
+    node {
+      ip_prefix { node { prefix { broadcast_address } } }
+      address { value ip }
+    }
+  }
+}
+"""
+
+ADDRESS_FIELDS = """
+__typename
+name { value }
+... on SecurityFQDN { fqdn { value } }
+... on SecurityIPAddress { address { value } }
+... on SecurityPrefix { prefix { value } }
+"""
+
+SERVICE_FIELDS = """
+__typename
+name { value }
+... on SecurityService { port { value } ip_protocol { node { name { value } } } }
+"""
+
+DEVICES_QUERY = """
+query BatchDevices($filter_values: [String], $offset: Int, $limit: Int) {
+  InfraGenericDevice(%%s: $filter_values, offset: $offset, limit: $limit) {
+    count
+    edges {
+      node {
+        id
+        __typename
+        name { value }
+        member_of_groups { edges { node { name { value } } } }
+        asn { node { asn { value } } }
+        primary_address { node { address { value } } }
+        topology { node { id } }
+        location { node { id } }
+        device_type { node { platform { node { containerlab_os { value } } } } }
+        interfaces {
+          edges {
+            node {
+              __typename
+              id
+              name { value }
+              description { value }
+              enabled { value }
+              role { value }
+              mtu { value }
+              ... on InfraInterfaceL2 {
+                tagged_vlan { edges { node { vlan_id { value } name { value } } } }
+                untagged_vlan { node { vlan_id { value } name { value } } }
+              }
+              ... on InfraInterfaceL3 { %(ip_addresses)s }
+              ... on SecurityFirewallInterface {
+                security_zone { node { name { value } } }
+                %(ip_addresses)s
+              }
+              ... on InfraEndpoint {
+                connected_endpoint {
+                  node {
+                    id
+                    ... on InfraInterface { name { value } device { node { name { value } } } }
+                  }
+                }
+              }
+            }
+          }
+        }
+        ... on SecurityFirewall {
+          rules {
+            edges {
+              node {
+                name { value }
+                action { value }
+                log { value }
+                source_zone { node { name { value } } }
+                destination_zone { node { name { value } } }
+                source_address { edges { node { %(address)s } } }
+                source_groups { edges { node { name { value } addresses { edges { node { %(address)s } } } } } }
+                destination_address { edges { node { %(address)s } } }
+                destination_groups { edges { node { name { value } addresses { edges { node { %(address)s } } } } } }
+                destination_services { edges { node { %(service)s } } }
+                destination_service_groups { edges { node { name { value } services { edges { node { %(service)s } } } } } }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+""" % {"ip_addresses": IP_ADDRESSES_FIELDS, "address": ADDRESS_FIELDS, "service": SERVICE_FIELDS}
+
+TOPOLOGIES_QUERY = """
+query BatchTopologies($ids: [ID]) {
+  TopologyTopology(ids: $ids) {
+    edges {
+      node {
+        id
+        name { value }
+        network_services {
+          edges {
+            node {
+              name { value }
+              service_type { value }
+              vlan { node { name { value } role { value } vlan_id { value } } }
+              prefix {
+                node {
+                  role { value }
+                  prefix { value }
+                  vrf { node { ... on InfraVRF { vrf_rd { value } } } }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+LOCATIONS_QUERY = """
+query BatchLocations($ids: [ID]) {
+  LocationGeneric(ids: $ids) {
+    edges {
+      node {
+        id
+        name { value }
+        timezone { value }
+        ... on LocationBuilding {
+          ancestors {
+            edges {
+              node {
+                network_management_servers { edges { node { __typename name { value } } } }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+VRFS_QUERY = """
+query BatchVRFs {
+  InfraVRF {
+    edges {
+      node {
+        id
+        name { value }
+        vrf_rd { value }
+        import_rt { node { name { value } } }
+        export_rt { node { name { value } } }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass
+class Renderer:
+    name: str
+    artifact_name: str
+    extension: str
+    # Shape of the data passed to `render`: device_info, srx_config or topology_info
+    query: str
+    render: Callable[[dict], str]
+    code_hash: str
+
+
+class BatchContext:
+    """Data shared by the devices of the batch, each part is queried and hashed once."""
+
+    def __init__(self) -> None:
+        self.devices: Dict[str, dict] = {}
+        self.topologies: Dict[str, dict] = {}
+        self.locations: Dict[str, dict] = {}
+        self.vrfs: List[dict] = []
+        # Topology id -> ids of its InfraDevice, in the order of the topology_info query
+        self.topology_devices: Dict[str, List[str]] = {}
+        self.queries = 0
+        self.hashes: Dict[Tuple[str, Optional[str]], str] = {}
+
+    def part_hash(self, kind: str, key: Optional[str] = None) -> str:
+        if (kind, key) not in self.hashes:
+            parts = {
+                "device": self.devices,
+                "topology": self.topologies,
+                "location": self.locations,
+                "vrfs": {None: self.vrfs},
+            }
+            self.hashes[(kind, key)] = canonical_hash(parts[kind].get(key))
+        return self.hashes[(kind, key)]
+
+    def data(self, query: str, target: str) -> dict:
+        """Returns the data of a device (or topology for topology_info) in the shape of the query."""
+        if query == "topology_info":
+            devices = [{"node": self.devices[device_id]} for device_id in self.topology_devices[target]]
+            return {"InfraDevice": {"edges": devices}}
+        device = self.devices[target]
+        if query == "srx_config":
+            return {"SecurityFirewall": {"edges": [{"node": device}]}}
+        node = dict(
+            device,
+            topology={"node": self.topologies.get(related_id(device, "topology"))},
+            location={"node": self.locations.get(related_id(device, "location"))},
+        )
+        return {"InfraDevice": {"edges": [{"node": node}]}, "InfraVRF": {"edges": self.vrfs}}
+
+    def data_hash(self, query: str, target: str) -> str:
+        """Returns the hash of `data(query, target)`, built from the hashes of the shared parts."""
+        if query == "topology_info":
+            return combine_hashes(*(self.part_hash("device", device_id) for device_id in self.topology_devices[target]))
+        device = self.devices[target]
+        if query == "srx_config":
+            return self.part_hash("device", target)
+        return combine_hashes(
+            self.part_hash("device", target),
+            self.part_hash("topology", related_id(device, "topology")),
+            self.part_hash("location", related_id(device, "location")),
+            self.part_hash("vrfs"),
+        )
+
+
+def related_id(device: dict, name: str) -> Optional[str]:
+    return (device[name]["node"] or {}).get("id")
+
+
+def get_jinja2_template(path: str) -> jinja2.Template:
+    # Same environment as the Jinja2 transforms
+    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(ROOT), trim_blocks=True, lstrip_blocks=True)
+    return environment.get_template(path)
+
+
+def get_code_hash(*paths: str) -> str:
+    # The way the data is assembled here is part of every render
+    return file_hash([Path(__file__), *(ROOT / path for path in paths)])
+
+
+def get_renderers() -> Dict[str, List[Renderer]]:
+    """Target group -> renderers of its artifacts, like the artifact definitions."""
+    cisco_template = get_jinja2_template("templates/device_cisco_config.tpl.j2")
+    return {
+        "arista_devices": [
+            Renderer(
+                name="AristaConfig",
+                artifact_name="startup-config",
+                extension="cfg",
+                query="device_info",
+                render=render_arista_config,
+                code_hash=get_code_hash("transforms/arista_config.py"),
+            ),
+            Renderer(
+                name="OCInterfaces",
+                artifact_name="openconfig-interfaces",
+                extension="json",
+                query="device_info",
+                render=lambda data: "".join(iter_oc_interfaces_json(data)),
+                code_hash=get_code_hash("transforms/openconfig.py"),
+            ),
+        ],
+        "cisco_devices": [
+            Renderer(
+                name="device_cisco",
+                artifact_name="startup-config",
+                extension="cfg",
+                query="device_info",
+                render=lambda data: cisco_template.render(data=data),
+                code_hash=get_code_hash("templates/device_cisco_config.tpl.j2"),
+            ),
+        ],
+        "firewall_devices": [
+            Renderer(
+                name="SRXConfig",
+                artifact_name="firewall-config",
+                extension="conf",
+                query="srx_config",
+                render=lambda data: "\n".join(iter_srx_config(data)),
+                code_hash=get_code_hash("transforms/srx_config.py"),
+            ),
+        ],
+    }
+
+
+def get_topology_renderer() -> Renderer:
+    return Renderer(
+        name="ClabTopology",
+        artifact_name="containerlab-topology",
+        extension="yml",
+        query="topology_info",
+        render=lambda data: "\n".join(iter_topology(data)),
+        code_hash=get_code_hash("transforms/clab_topology.py"),
+    )
+
+
+async def query_devices(client: InfrahubClient, context: BatchContext, filter_name: str, filter_values: List[str]) -> List[dict]:
+    query = DEVICES_QUERY % filter_name
+    devices = []
+    offset = 0
+    while True:
+        response = await client.execute_graphql(
+            query=query, variables={"filter_values": filter_values, "offset": offset, "limit": PAGE_SIZE}
+        )
+        context.queries += 1
+        page = response["InfraGenericDevice"]
+        devices.extend(edge["node"] for edge in page["edges"])
+        offset += PAGE_SIZE
+        if offset >= page["count"] or not page["edges"]:
+            break
+
+    context.devices.update((device["id"], device) for device in devices)
+    for device in devices:
+        # topology_info only reads InfraDevice, the firewalls of the topology are left out
+        if device["__typename"] == "InfraDevice" and device["topology"]["node"]:
+            context.topology_devices.setdefault(device["topology"]["node"]["id"], []).append(device["id"])
+    return devices
+
+
+async def load_context(client: InfrahubClient, context: BatchContext, devices: List[dict], groups: List[str]) -> None:
+    topology_ids = {related_id(device, "topology") for device in devices} - {None}
+    location_ids = {related_id(device, "location") for device in devices} - {None}
+
+    if topology_ids:
+        response = await client.execute_graphql(query=TOPOLOGIES_QUERY, variables={"ids": sorted(topology_ids)})
+        context.topologies = {edge["node"]["id"]: edge["node"] for edge in response["TopologyTopology"]["edges"]}
+        context.queries += 1
+    if location_ids:
+        response = await client.execute_graphql(query=LOCATIONS_QUERY, variables={"ids": sorted(location_ids)})
+        context.locations = {edge["node"]["id"]: edge["node"] for edge in response["LocationGeneric"]["edges"]}
+        context.queries += 1
+    if "arista_devices" in groups or "cisco_devices" in groups:
+        response = await client.execute_graphql(query=VRFS_QUERY)
+        context.vrfs = response["InfraVRF"]["edges"]
+        context.queries += 1
+
+
+def render(context: BatchContext, cache: Optional[RenderCache], renderer: Renderer, target: str) -> str:
+    if not cache:
+        return renderer.render(context.data(renderer.query, target))
+    data_hash = context.data_hash(renderer.query, target)
+    content = cache.get(renderer.name, renderer.code_hash, data_hash)
+    if content is None:
+        content = renderer.render(context.data(renderer.query, target))
+        cache.set(renderer.name, renderer.code_hash, data_hash, content)
+    return content
+
+
+def write_artifact(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def render_devices(
+    log: logging.Logger,
+    context: BatchContext,
+    cache: Optional[RenderCache],
+    devices: List[dict],
+    renderers: Dict[str, List[Renderer]],
+    output: Path,
+) -> List[str]:
+    """Renders and writes the artifacts of every device, returns the names of the devices which failed."""
+    failed = []
+    for device in devices:
+        name = device["name"]["value"]
+        device_groups = [edge["node"]["name"]["value"] for edge in device["member_of_groups"]["edges"]]
+        for group in device_groups:
+            for renderer in renderers.get(group, []):
+                try:
+                    content = render(context, cache, renderer, device["id"])
+                except Exception as exc:
+                    log.error(f"- Failed to render {renderer.artifact_name} of {name}: {exc}")
+                    failed.append(name)
+                    continue
+                write_artifact(output / "devices" / name / f"{renderer.artifact_name}.{renderer.extension}", content)
+    return failed
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run transforms/render_batch.py topology=<name>
+#   infrahubctl run transforms/render_batch.py group=arista_devices
+#
+#   Without topology or group, all the devices of the artifact target groups are rendered,
+#   the containerlab topology is only rendered with topology
+#   Optional: output=generated-configs/batch, directory where the artifacts are written
+#             cache=false, reuse the renders of unchanged devices from .infrahub/render_cache
+#
+# ---------------------------------------------------------------
+async def run(client: InfrahubClient, log: logging.Logger, branch: str, **kwargs) -> None:
+    start = time.perf_counter()
+    renderers = get_renderers()
+    context = BatchContext()
+    cache = RenderCache() if str(kwargs.get("cache", "false")).lower() == "true" else None
+
+    if "topology" in kwargs:
+        devices = await query_devices(client, context, "topology__name__values", [kwargs["topology"]])
+    else:
+        groups = [kwargs["group"]] if "group" in kwargs else list(DEFAULT_GROUPS)
+        devices = await query_devices(client, context, "member_of_groups__name__values", groups)
+
+    device_groups = {edge["node"]["name"]["value"] for device in devices for edge in device["member_of_groups"]["edges"]}
+    await load_context(client, context, devices, sorted(device_groups & set(renderers)))
+    log.info(f"Loaded {len(devices)} devices with {context.queries} queries in {time.perf_counter() - start:.2f}s")
+
+    output = Path(kwargs.get("output", DEFAULT_OUTPUT))
+    failed = render_devices(log, context, cache, devices, renderers, output)
+    log.info(f"Rendered {len(devices) - len(set(failed))}/{len(devices)} devices into {output} in {time.perf_counter() - start:.2f}s")
+
+    if "topology" in kwargs:
+        topology_renderer = get_topology_renderer()
+        for topology_id in context.topology_devices:
+            name = context.topologies[topology_id]["name"]["value"]
+            try:
+                content = render(context, cache, topology_renderer, topology_id)
+            except Exception as exc:
+                log.error(f"- Failed to render {topology_renderer.artifact_name} of {name}: {exc}")
+                failed.append(name)
+                continue
+            write_artifact(
+                output / "topologies" / name / f"{topology_renderer.artifact_name}.{topology_renderer.extension}", content
+            )
+
+    if cache:
+        stats = cache.save()
+        for name in sorted(set(cache.hits) | set(cache.misses)):
+            total = stats[name]["hits"] + stats[name]["misses"]
+            log.info(
+                f"- {name}: {cache.hits[name]} hits, {cache.misses[name]} misses ({cache.hit_rate(name):.1%}), "
+                f"{stats[name]['hits'] / total:.1%} over all runs"
+            )
+    if failed:
+        log.error(f"Failed renders: {', '.join(sorted(set(failed)))}")
+        exit(1)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Rendered artifacts stored by content hash.
+#
+#   The key of an entry is the hash of the renderer name, of the renderer code or template and of
+#   the canonical JSON of the data it renders, so any change to one of them is a miss. Entries not
+#   used for CACHE_MAX_AGE are removed when the cache is saved.
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CACHE_DIRECTORY = ROOT / ".infrahub" / "render_cache"
+CACHE_MAX_AGE = 7 * 24 * 3600
+STATS_FILE = "stats.json"
+
+
+def canonical_hash(data) -> str:
+    document = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(document.encode()).hexdigest()
+
+
+def combine_hashes(*hashes: str) -> str:
+    return hashlib.sha256("\0".join(hashes).encode()).hexdigest()
+
+
+def file_hash(paths: Iterable[Path]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def write_atomic(path: Path, content: str) -> None:
+    # Concurrent runs each write their own temporary file, the last rename wins
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RenderCache:
+    """Rendered artifacts by (renderer, code hash, data hash), with hit and miss counters per renderer."""
+
+    def __init__(self, directory: Path = CACHE_DIRECTORY) -> None:
+        self.directory = Path(directory)
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def path(self, name: str, code_hash: str, data_hash: str) -> Path:
+        key = combine_hashes(name, code_hash, data_hash)
+        return self.directory / key[:2] / key
+
+    def get(self, name: str, code_hash: str, data_hash: str) -> Optional[str]:
+        path = self.path(name, code_hash, data_hash)
+        try:
+            content = path.read_text()
+            # Unlike touch, utime doesn't recreate an entry pruned by a concurrent run in the meantime
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses[name] += 1
+            return None
+        self.hits[name] += 1
+        return content
+
+    def set(self, name: str, code_hash: str, data_hash: str, content: str) -> None:
+        write_atomic(self.path(name, code_hash, data_hash), content)
+
+    def hit_rate(self, name: Optional[str] = None) -> float:
+        hits = self.hits[name] if name else sum(self.hits.values())
+        total = hits + (self.misses[name] if name else sum(self.misses.values()))
+        return hits / total if total else 0.0
+
+    def save(self, max_age: int = CACHE_MAX_AGE) -> dict:
+        """Adds the counters of this run to the cumulative statistics, removes the stale entries and returns the statistics."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stats_path = self.directory / STATS_FILE
+        try:
+            stats = json.loads(stats_path.read_text()) if stats_path.exists() else {}
+        except ValueError:
+            stats = {}
+        for name in set(self.hits) | set(self.misses):
+            entry = stats.setdefault(name, {"hits": 0, "misses": 0})
+            entry["hits"] += self.hits[name]
+            entry["misses"] += self.misses[name]
+        write_atomic(stats_path, json.dumps(stats, indent=2, sort_keys=True))
+
+        now = time.time()
+        for path in self.directory.glob("*/*"):
+            try:
+                if now - path.stat().st_mtime >= max_age:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+        return stats
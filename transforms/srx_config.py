@@ -0,0 +1,226 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from infrahub_sdk.transforms import InfrahubTransform
+
+# Python version of templates/juniper_srx_config.j2.
+#
+#   - The rules are grouped by zone pair in one pass, which also collects the address, address group,
+#     service and service group objects they reference: only those are rendered, the query reads them
+#     through the rules instead of reading the whole catalog
+#   - One statement per line, the template joined some of them on a single line
+#   - Like the template, only the first address of an interface is rendered. An interface without
+#     address gets `family inet;`, the template failed on it
+
+SYSTEM_HEADER = """system {
+    root-authentication {
+        encrypted-password "YOUR_ROOT_PASSWORD";
+    }
+    services {
+        ssh;
+        web-management {"""
+
+SYSTEM_FOOTER = """        }
+    }
+    syslog {
+        user * {
+            any emergency;
+        }
+        file messages {
+            any critical;
+            authorization info;
+        }
+    }
+}"""
+
+LOG_SESSION = """                    log {
+                        session-init;
+                        session-close;
+                    }"""
+
+# Rule relationship -> match statement
+ADDRESS_MATCHES = (
+    ("source_address", "source-address"),
+    ("source_groups", "source-address"),
+    ("destination_address", "destination-address"),
+    ("destination_groups", "destination-address"),
+)
+SERVICE_MATCHES = (
+    ("destination_services", "application"),
+    ("destination_service_groups", "application-set"),
+)
+
+
+def get_name(node: dict) -> str:
+    return node["name"]["value"]
+
+
+def get_value(node: dict, name: str) -> Optional[str]:
+    return (node.get(name) or {}).get("value")
+
+
+class PolicyIndex:
+    """Rules by zone pair and the objects they reference by name, in order of first reference."""
+
+    def __init__(self, rules: List[dict]) -> None:
+        self.zone_pairs: Dict[Tuple[str, str], List[dict]] = {}
+        self.addresses: Dict[str, dict] = {}
+        self.address_groups: Dict[str, dict] = {}
+        self.services: Dict[str, dict] = {}
+        self.service_groups: Dict[str, dict] = {}
+
+        for rule in rules:
+            zone_pair = (get_name(rule["source_zone"]["node"]), get_name(rule["destination_zone"]["node"]))
+            self.zone_pairs.setdefault(zone_pair, []).append(rule)
+
+            for name in ("source_address", "destination_address"):
+                for edge in rule[name]["edges"]:
+                    self.addresses.setdefault(get_name(edge["node"]), edge["node"])
+            for name in ("source_groups", "destination_groups"):
+                for edge in rule[name]["edges"]:
+                    self.add_group(self.address_groups, self.addresses, edge["node"], "addresses")
+            for edge in rule["destination_services"]["edges"]:
+                self.services.setdefault(get_name(edge["node"]), edge["node"])
+            for edge in rule["destination_service_groups"]["edges"]:
+                self.add_group(self.service_groups, self.services, edge["node"], "services")
+
+    @staticmethod
+    def add_group(groups: Dict[str, dict], members: Dict[str, dict], group: dict, relationship: str) -> None:
+        if get_name(group) in groups:
+            return
+        groups[get_name(group)] = group
+        # The members of a set must be defined as well
+        for edge in (group.get(relationship) or {}).get("edges", []):
+            members.setdefault(get_name(edge["node"]), edge["node"])
+
+
+def iter_system(interfaces: List[dict]) -> Iterator[str]:
+    management_interface = None
+    for interface in interfaces:
+        if get_value(interface, "role") == "management":
+            management_interface = get_name(interface)
+
+    yield SYSTEM_HEADER
+    yield "            http {"
+    if management_interface:
+        yield f"                interface {management_interface};"
+    yield "            }"
+    yield "            https {"
+    yield "                system-generated-certificate;"
+    if management_interface:
+        yield f"                interface {management_interface};"
+    yield "            }"
+    yield SYSTEM_FOOTER
+
+
+def iter_interfaces(interfaces: List[dict]) -> Iterator[str]:
+    yield "interfaces {"
+    for interface in interfaces:
+        yield f"    {get_name(interface)} {{"
+        yield "        unit 0 {"
+        ip_addresses = (interface.get("ip_addresses") or {}).get("edges", [])
+        if ip_addresses:
+            yield "            family inet {"
+            yield f"                address {ip_addresses[0]['node']['address']['value']};"
+            yield "            }"
+        else:
+            yield "            family inet;"
+        yield "        }"
+        yield "    }"
+    yield "}"
+
+
+def iter_applications(index: PolicyIndex) -> Iterator[str]:
+    yield "applications {"
+    for name, service in index.services.items():
+        # Other kinds of services are referenced by name only, like in the template
+        if service.get("__typename", "SecurityService") != "SecurityService":
+            continue
+        yield f"    application {name} {{"
+        yield f"        protocol {get_name(service['ip_protocol']['node']).lower()};"
+        yield f"        destination-port {get_value(service, 'port')};"
+        yield "    }"
+    for name, group in index.service_groups.items():
+        yield f"    application-set {name} {{"
+        for edge in group["services"]["edges"]:
+            yield f"        application {get_name(edge['node'])};"
+        yield "    }"
+    yield "}"
+
+
+def iter_zones(interfaces: List[dict]) -> Iterator[str]:
+    security_zones: Dict[str, List[str]] = {}
+    for interface in interfaces:
+        if "security_zone" in interface and get_name(interface["security_zone"]["node"]):
+            security_zones.setdefault(get_name(interface["security_zone"]["node"]), []).append(get_name(interface))
+
+    yield "    zones {"
+    for security_zone, zone_interfaces in security_zones.items():
+        yield f"        security-zone {security_zone} {{"
+        yield "            interfaces {"
+        for interface in zone_interfaces:
+            yield f"                {interface};"
+        yield "            }"
+        yield "        }"
+    yield "    }"
+
+
+def iter_address_book(index: PolicyIndex) -> Iterator[str]:
+    yield "    address-book global {"
+    for name, address in index.addresses.items():
+        kind = address["__typename"]
+        if kind == "SecurityPrefix":
+            yield f"        address {name} {get_value(address, 'prefix')};"
+        elif kind == "SecurityIPAddress":
+            yield f"        address {name} {get_value(address, 'address')};"
+        elif kind == "SecurityFQDN":
+            yield f"        address {name} dns-name {get_value(address, 'fqdn')};"
+    for name, group in index.address_groups.items():
+        yield f"        address-set {name} {{"
+        for edge in group["addresses"]["edges"]:
+            yield f"            address {get_name(edge['node'])};"
+        yield "        }"
+    yield "    }"
+
+
+def iter_policies(index: PolicyIndex) -> Iterator[str]:
+    yield "    policies {"
+    for (source_zone, destination_zone), rules in index.zone_pairs.items():
+        yield f"        from-zone {source_zone} to-zone {destination_zone} {{"
+        for rule in rules:
+            yield f"            policy {get_name(rule)} {{"
+            yield "                match {"
+            for relationship, statement in ADDRESS_MATCHES + SERVICE_MATCHES:
+                for edge in rule[relationship]["edges"]:
+                    yield f"                    {statement} {get_name(edge['node'])};"
+            yield "                }"
+            yield "                then {"
+            yield f"                    {rule['action']['value']};"
+            if rule["log"]["value"]:
+                yield LOG_SESSION
+            yield "                }"
+            yield "            }"
+        yield "        }"
+    yield "    }"
+
+
+def iter_config(data: dict) -> Iterator[str]:
+    device = data["SecurityFirewall"]["edges"][0]["node"]
+    interfaces = [edge["node"] for edge in device["interfaces"]["edges"]]
+    index = PolicyIndex([edge["node"] for edge in device["rules"]["edges"]])
+
+    yield from iter_system(interfaces)
+    yield from iter_interfaces(interfaces)
+    yield from iter_applications(index)
+    yield "security {"
+    yield from iter_zones(interfaces)
+    yield from iter_address_book(index)
+    yield from iter_policies(index)
+    yield "}"
+
+
+class SRXConfig(InfrahubTransform):
+
+    query = "srx_config"
+
+    async def transform(self, data):
+        return "\n".join(iter_config(data))